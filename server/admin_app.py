@@ -0,0 +1,243 @@
+"""Admin app: trang quản trị (upload ảnh đăng ký, gallery ảnh debug, WiFi).
+
+Không nạp InsightFace/onnxruntime: ảnh đăng ký mới chỉ được lưu và đánh
+dấu trong hàng đợi đăng ký, inference app sẽ embed; xóa UID thì xóa
+thẳng khỏi gallery chung.
+"""
+import hashlib
+import os
+from collections import OrderedDict
+
+import jinja2
+
+from fastapi import APIRouter, FastAPI, File, Form, HTTPException, Query, Request, UploadFile
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response
+from fastapi.staticfiles import StaticFiles
+
+from body_limits import MAX_UPLOAD_BYTES, UPLOAD_CHUNK, BodyLimitMiddleware, save_upload_image
+from config import FACE_FOLDER, TEMPLATE_DIR, UPLOAD_FOLDER, UPLOAD_PASSWORD, WIFI_PANEL_PASSWORD
+from shared import enrollments, face_gallery, uid_directory, upload_index
+from upload_index import ThumbnailWorker
+from wifi_config import etag_matches, wifi_config
+
+router = APIRouter()
+
+# Thread tạo thumbnail cho /gallery
+thumbnails = ThumbnailWorker(UPLOAD_FOLDER)
+GALLERY_PER_PAGE = 60
+GALLERY_MAX_PER_PAGE = 500
+UID_PER_PAGE = 100
+UID_MAX_PER_PAGE = 1000
+
+# Template được compile một lần khi import; auto_reload=False nên lúc render không stat file
+templates = jinja2.Environment(loader=jinja2.FileSystemLoader(TEMPLATE_DIR), autoescape=True, auto_reload=False)
+UPLOAD_PANEL_TEMPLATE = templates.get_template("upload_panel.html")
+GALLERY_TEMPLATE = templates.get_template("gallery.html")
+
+
+class PageCache:
+    """HTML đã render theo tham số trang, bỏ toàn bộ khi version đổi"""
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self.version = None
+        self._entries = OrderedDict()
+
+    def get(self, version, key):
+        if version != self.version:
+            self.version = version
+            self._entries.clear()
+            return None
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
+
+
+panel_cache = PageCache()
+gallery_cache = PageCache()
+
+
+def install(app: FastAPI):
+    """Gắn các route quản trị và thư mục ảnh tĩnh vào app"""
+    app.mount("/uploads", StaticFiles(directory=UPLOAD_FOLDER), name="uploads")
+    app.mount("/face_data", StaticFiles(directory=FACE_FOLDER), name="face_data")
+    app.include_router(router)
+    # Chặn ảnh đăng ký quá lớn trước khi Starlette parse multipart (thêm UPLOAD_CHUNK cho các field form)
+    app.add_middleware(BodyLimitMiddleware, max_bytes=MAX_UPLOAD_BYTES + UPLOAD_CHUNK,
+                       paths=("/upload_panel/upload",))
+
+def delete_uid_file(uid: str):
+    """Xóa file ảnh và cache của UID"""
+    deleted = False
+    for ext in [".jpg", ".jpeg", ".png"]:
+        path = os.path.join(FACE_FOLDER, f"{uid}{ext}")
+        if os.path.exists(path):
+            os.remove(path)
+            deleted = True
+    
+    if deleted:
+        # Xóa khỏi gallery chung (inference app thấy ngay qua manifest) và hủy đăng ký đang chờ
+        face_gallery.remove(uid)
+        enrollments.claim(uid)
+    
+    return deleted
+
+# ============= WiFi Config =============
+# ESP32 lấy config qua /wifi_config ở inference app (xem wifi_config.py), ở đây chỉ có trang sửa
+
+def load_wifi():
+    wifi_config.refresh()
+    return wifi_config.config
+
+def save_wifi(ssid, password):
+    wifi_config.save(ssid, password)
+
+@router.get("/wifi_panel", response_class=HTMLResponse)
+async def wifi_panel():
+    wifi = load_wifi()
+    return f"""
+    <html>
+    <head><title>WiFi Configuration</title></head>
+    <body style='font-family:Arial;padding:30px;'>
+        <h2>WiFi Configuration</h2>
+        <form method="POST" action="/wifi_panel">
+            <label>Admin Password:</label><br>
+            <input type="password" name="admin_pw" required><br><br>
+            <label>WiFi SSID:</label><br>
+            <input type="text" name="ssid" value="{wifi['ssid']}" required><br><br>
+            <label>WiFi Password:</label><br>
+            <input type="text" name="password" value="{wifi['password']}" required><br><br>
+            <button type="submit">Update WiFi</button>
+        </form>
+        <hr>
+        <p><b>Current Saved WiFi:</b><br>
+        SSID: {wifi['ssid']}<br>
+        Password: {wifi['password']}</p>
+    </body>
+    </html>
+    """
+
+@router.post("/wifi_panel", response_class=HTMLResponse)
+async def update_wifi(admin_pw: str = Form(...), ssid: str = Form(...), password: str = Form(...)):
+    if admin_pw != WIFI_PANEL_PASSWORD:
+        return HTMLResponse("Sai mật khẩu Admin<br><a href='/wifi_panel'>Quay lại</a>")
+    save_wifi(ssid, password)
+    return HTMLResponse(f"WiFi đã cập nhật!<br>SSID: {ssid}<br><a href='/wifi_panel'>Quay lại</a>")
+
+# ============= Upload Panel =============
+def enrolled_version():
+    """Phiên bản danh sách UID: đổi khi gallery chung đổi (embed/xóa), face_data/ thêm/xóa/thay file
+    hoặc hàng đợi đăng ký đổi"""
+    face_gallery.refresh()
+    return (face_gallery.version, os.stat(FACE_FOLDER).st_mtime_ns,
+            os.stat(enrollments.folder).st_mtime_ns)
+
+@router.get("/upload_panel", response_class=HTMLResponse)
+async def upload_panel_get(request: Request, page: int = Query(1, ge=1),
+                           per_page: int = Query(UID_PER_PAGE, ge=1, le=UID_MAX_PER_PAGE)):
+    version = enrolled_version()
+    cached = panel_cache.get(version, (page, per_page))
+    if cached is None:
+        # Quét lại ngay (chỉ khi mtime face_data/ đổi) để danh sách khớp version vừa tính
+        uid_directory.refresh(force=True)
+        files = uid_directory.items()
+        pages = max(1, -(-len(files) // per_page))
+        # Chỉ UID còn trong hàng đợi đăng ký là "chờ embed" (ảnh không có mặt thì không bao giờ vào gallery)
+        pending = set(enrollments.pending())
+        rows = [(uid, fn, uid in pending) for uid, fn in files[(page - 1) * per_page:page * per_page]]
+        html = UPLOAD_PANEL_TEMPLATE.render(rows=rows, total=len(files), page=page, pages=pages, per_page=per_page)
+        digest = hashlib.sha1(f"{version}:{page}:{per_page}".encode()).hexdigest()[:16]
+        cached = panel_cache.put((page, per_page), (html, f'"{digest}"'))
+    html, etag = cached
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return HTMLResponse(html, headers={"ETag": etag})
+
+@router.post("/upload_panel/upload", response_class=HTMLResponse)
+async def upload_face(password: str = Form(...), uid: str = Form(...), file: UploadFile = File(...)):
+    if password != UPLOAD_PASSWORD:
+        raise HTTPException(status_code=403, detail="Sai mật khẩu")
+    
+    if not file.filename.lower().endswith((".jpg", ".jpeg", ".png")):
+        raise HTTPException(status_code=400, detail="Chỉ hỗ trợ file .jpg, .jpeg, .png")
+    
+    # Lưu với extension gốc
+    ext = os.path.splitext(file.filename)[1]
+    save_path = os.path.join(FACE_FOLDER, f"{uid}{ext}")
+    
+    # Ghi từng chunk xuống đĩa (kiểm tra magic bytes, giới hạn dung lượng, rename nguyên tử)
+    await save_upload_image(file, save_path)
+    
+    # Embedding cũ (nếu có) không còn đúng; inference app embed ảnh mới qua hàng đợi đăng ký
+    face_gallery.remove(uid)
+    enrollments.mark(uid)
+    msg = f"Upload thành công: {uid} ✓ (đang tạo embedding)"
+    
+    return HTMLResponse(f"{msg}<br><a href='/upload_panel'>⬅ Quay lại</a>")
+
+@router.post("/upload_panel/delete", response_class=HTMLResponse)
+async def delete_face(password: str = Form(...), delete_uid: str = Form(...)):
+    if password != UPLOAD_PASSWORD:
+        raise HTTPException(status_code=403, detail="Sai mật khẩu")
+    success = delete_uid_file(delete_uid)
+    return HTMLResponse(f"{'Đã xóa UID: ' + delete_uid if success else 'Không tìm thấy UID'}<br><a href='/upload_panel'>⬅ Quay lại</a>")
+
+# ============= Gallery =============
+def gallery_page(page: int, per_page: int):
+    """Lấy một trang ảnh (mới nhất trước), ETag tính từ nội dung trang"""
+    total, items = upload_index.page(page, per_page)
+    digest = hashlib.sha1(f"{total}:{page}:{per_page}:{','.join(items)}".encode()).hexdigest()[:16]
+    return total, items, f'"{digest}"'
+
+@router.get("/gallery/thumb/{name}")
+async def gallery_thumb(name: str):
+    """Trả thumbnail nếu đã có, nếu chưa thì xếp hàng tạo và trả ảnh gốc"""
+    name = os.path.basename(name)
+    thumb_path = thumbnails.thumb_path(name)
+    if os.path.exists(thumb_path):
+        return FileResponse(thumb_path, headers={"Cache-Control": "public, max-age=86400"})
+    path = os.path.join(UPLOAD_FOLDER, name)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Không tìm thấy ảnh")
+    thumbnails.request(name)
+    return FileResponse(path, headers={"Cache-Control": "no-cache"})
+
+@router.get("/gallery/list")
+async def gallery_list(request: Request, page: int = Query(1, ge=1),
+                       per_page: int = Query(GALLERY_PER_PAGE, ge=1, le=GALLERY_MAX_PER_PAGE)):
+    """Danh sách ảnh dạng JSON, có ETag/304"""
+    total, items, etag = gallery_page(page, per_page)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    for f in items:
+        thumbnails.request(f)
+    return JSONResponse({
+        "total": total,
+        "page": page,
+        "per_page": per_page,
+        "items": [{"name": f, "url": f"/uploads/{f}", "thumb": f"/gallery/thumb/{f}"} for f in items],
+    }, headers={"ETag": etag})
+
+@router.get("/gallery", response_class=HTMLResponse)
+async def gallery(request: Request, page: int = Query(1, ge=1),
+                  per_page: int = Query(GALLERY_PER_PAGE, ge=1, le=GALLERY_MAX_PER_PAGE)):
+    total, items, etag = gallery_page(page, per_page)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    # Trang chỉ phụ thuộc ETag (tính từ nội dung trang); có ảnh mới thì total đổi và cache được làm mới
+    html = gallery_cache.get(total, etag)
+    if html is None:
+        for f in items:
+            thumbnails.request(f)
+        pages = max(1, -(-total // per_page))
+        html = gallery_cache.put(etag, GALLERY_TEMPLATE.render(
+            items=items, total=total, page=page, pages=pages, per_page=per_page))
+    return HTMLResponse(html, headers={"ETag": etag})
@@ -0,0 +1,91 @@
+"""Đo độ chính xác của gallery float16 / int8 so với float32.
+
+Chạy từ thư mục server/:
+
+    python -m bench.gallery_precision [--size 100000] [--probes 20000]
+    python -m bench.gallery_precision --embeddings gallery.npy
+
+Gallery lấy từ file .npy (N x 512) hoặc sinh ngẫu nhiên. Probe được tạo
+quanh từng UID với độ tương đồng trải đều quanh THRESHOLD, để đo:
+  - decision agreement: tỉ lệ quyết định match (>= THRESHOLD) trùng float32
+  - sai số similarity (max / trung bình)
+  - recall@1 khi tìm 1:N trên cả gallery, so với kết quả float32
+  - RAM mỗi danh tính và thời gian chấm điểm cả gallery
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from config import THRESHOLD
+from gallery_store import GALLERY_DTYPES, dequantize, quantize, score_block
+
+
+def normalize(x):
+    return x / np.linalg.norm(x, axis=-1, keepdims=True)
+
+
+def make_probes(gallery, count, rng, sim_range=(0.2, 0.8)):
+    """Probe có cosine similarity mục tiêu (trải đều trong sim_range) với một UID ngẫu nhiên"""
+    idx = rng.integers(0, gallery.shape[0], count)
+    target = rng.uniform(*sim_range, count).astype(np.float32)
+    base = gallery[idx]
+    noise = normalize(rng.standard_normal(base.shape).astype(np.float32))
+    noise = normalize(noise - (noise * base).sum(axis=1, keepdims=True) * base)
+    probes = base * target[:, None] + noise * np.sqrt(1 - target ** 2)[:, None]
+    return idx, normalize(probes).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--embeddings", help="File .npy chứa embedding float32 (N x 512)")
+    parser.add_argument("--size", type=int, default=100000, help="Số UID khi sinh ngẫu nhiên")
+    parser.add_argument("--probes", type=int, default=20000)
+    parser.add_argument("--search-probes", type=int, default=200, help="Số probe tìm 1:N")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.embeddings:
+        gallery = normalize(np.load(args.embeddings).astype(np.float32))
+    else:
+        gallery = normalize(rng.standard_normal((args.size, 512)).astype(np.float32))
+
+    idx, probes = make_probes(gallery, args.probes, rng)
+    ref_sims = (gallery[idx] * probes).sum(axis=1)
+    ref_match = ref_sims >= THRESHOLD
+
+    search_probes = probes[:args.search_probes]
+    ref_top1 = score_block(gallery, None, search_probes).argmax(axis=0)
+
+    for dtype in GALLERY_DTYPES:
+        data, scales = quantize(gallery, dtype)
+        rows = dequantize(data[idx], None if scales is None else scales[idx])
+        sims = (rows * probes).sum(axis=1)
+        match = sims >= THRESHOLD
+        err = np.abs(sims - ref_sims)
+        near = np.abs(ref_sims - THRESHOLD) < 0.01
+
+        t = time.perf_counter()
+        top1 = score_block(data, scales, search_probes).argmax(axis=0)
+        search_ms = (time.perf_counter() - t) * 1000.0 / max(len(search_probes), 1)
+
+        bytes_per_id = data.itemsize * data.shape[1] + (4 if scales is not None else 0)
+        print(json.dumps({
+            "dtype": dtype,
+            "identities": int(gallery.shape[0]),
+            "bytes_per_identity": bytes_per_id,
+            "ram_mb_per_1m": round(bytes_per_id * 1e6 / 2 ** 20, 1),
+            "decision_agreement": round(float((match == ref_match).mean()), 6),
+            "decision_agreement_near_threshold": round(float((match[near] == ref_match[near]).mean()), 6)
+            if near.any() else None,
+            "sim_abs_err_max": round(float(err.max()), 6),
+            "sim_abs_err_mean": round(float(err.mean()), 7),
+            "recall_at_1_vs_float32": round(float((top1 == ref_top1).mean()), 6),
+            "search_ms_per_probe": round(search_ms, 2),
+        }))
+
+
+if __name__ == "__main__":
+    main()
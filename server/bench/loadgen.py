@@ -0,0 +1,252 @@
+"""Giả lập nhiều cửa (cặp ESP32-DEV + ESP32-CAM) gửi tải tới server.
+
+Chạy từ thư mục server/ (server đang chạy ở --url):
+
+    python -m bench.loadgen --doors 20 --duration 60
+    python -m bench.loadgen --ramp 5,10,20,40 --pattern morning_rush --slo-ms 3000
+
+Mỗi lượt quẹt thẻ đi đúng giao thức của thiết bị:
+  DEV: POST /precheck {"uid"} -> nếu "yes", poll GET /result?uid= tới khi yess/noo
+  CAM: gửi chuỗi frame POST /recognize (X-UID, frame cuối có X-Last-Frame: 1)
+Lượt quẹt đến theo quá trình Poisson, tốc độ thay đổi theo --pattern.
+UID lấy từ face_data/ (known) hoặc sinh ngẫu nhiên (unknown) theo --unknown-ratio.
+Kết quả: phân bố thời gian mở cửa, tỉ lệ lỗi (tính cả 413/429), tỉ lệ 429 và 428,
+latency từng endpoint; với --ramp, điểm bão hòa là mức số cửa đầu tiên vượt SLO
+hoặc tỉ lệ lỗi cho phép.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import math
+import os
+import random
+import time
+from collections import Counter, defaultdict
+
+import httpx
+import numpy as np
+
+from config import IMAGE_EXTS
+
+# Mã trạng thái tính là lỗi: request hỏng/bị từ chối vì quá tải (413 body quá lớn, 429 bị giới hạn) và 5xx
+FAILED_STATUS = (400, 413, 429)
+
+
+def arrival_rate(pattern: str, base_rate: float, t: float, duration: float) -> float:
+    """Số lượt quẹt/giây của một cửa tại thời điểm t"""
+    if pattern == "morning_rush":
+        # Đỉnh gấp 6 lần ở giữa khoảng chạy (phân bố chuông)
+        x = (t / max(duration, 1e-6)) - 0.5
+        return base_rate * (1 + 5 * math.exp(-(x / 0.15) ** 2))
+    if pattern == "burst":
+        # 10 giây cao điểm (x8) mỗi phút
+        return base_rate * (8 if (t % 60) < 10 else 1)
+    return base_rate
+
+
+class Stats:
+    def __init__(self):
+        self.unlock_ms = defaultdict(list)  # outcome -> [ms]
+        self.request_ms = defaultdict(list)  # endpoint -> [ms]
+        self.status = Counter()              # (endpoint, status) -> count
+        self.errors = Counter()              # endpoint -> count (lỗi kết nối/timeout)
+        self.swipes = 0
+        self.in_flight_max = 0.0
+
+    def summary(self, elapsed: float) -> dict:
+        def pct(values):
+            if not values:
+                return None
+            arr = np.array(values)
+            return {"count": int(arr.size), "p50_ms": round(float(np.percentile(arr, 50)), 1),
+                    "p95_ms": round(float(np.percentile(arr, 95)), 1),
+                    "p99_ms": round(float(np.percentile(arr, 99)), 1),
+                    "max_ms": round(float(arr.max()), 1)}
+
+        requests = sum(self.status.values()) + sum(self.errors.values())
+        failed = sum(self.errors.values()) + sum(c for (_, code), c in self.status.items()
+                                                 if code >= 500 or code in FAILED_STATUS)
+        throttled = sum(c for (_, code), c in self.status.items() if code == 429)
+        recognize = sum(c for (ep, _), c in self.status.items() if ep == "recognize")
+        return {
+            "swipes": self.swipes,
+            "requests": requests,
+            "requests_per_sec": round(requests / elapsed, 1) if elapsed else None,
+            "error_rate": round(failed / requests, 4) if requests else 0.0,
+            "rate_429": round(throttled / requests, 4) if requests else 0.0,
+            "rate_428": round(self.status[("recognize", 428)] / recognize, 4) if recognize else 0.0,
+            "unlock": {outcome: pct(v) for outcome, v in self.unlock_ms.items()},
+            "endpoints": {ep: pct(v) for ep, v in self.request_ms.items()},
+            "status_codes": {f"{ep}:{code}": c for (ep, code), c in sorted(self.status.items())},
+            "transport_errors": dict(self.errors),
+            "server_in_flight_max": self.in_flight_max,
+        }
+
+
+async def call(client, stats, endpoint, method, url, **kwargs):
+    t0 = time.perf_counter()
+    try:
+        resp = await client.request(method, url, **kwargs)
+    except httpx.HTTPError:
+        stats.errors[endpoint] += 1
+        return None
+    stats.request_ms[endpoint].append((time.perf_counter() - t0) * 1000.0)
+    stats.status[(endpoint, resp.status_code)] += 1
+    return resp
+
+
+async def run_swipe(client, stats, args, door_id, uid, frames):
+    """Một lượt quẹt thẻ: precheck -> CAM gửi frame song song với DEV poll kết quả"""
+    stats.swipes += 1
+    t0 = time.perf_counter()
+    # Mỗi cửa một X-Device-ID (server giới hạn /precheck theo thiết bị)
+    resp = await call(client, stats, "precheck", "POST", "/precheck", json={"uid": uid},
+                      headers={"X-Device-ID": f"door-{door_id}"})
+    if resp is not None and resp.status_code == 429:
+        # Bị giới hạn tần suất, không phải UID bị từ chối
+        stats.unlock_ms["throttled"].append((time.perf_counter() - t0) * 1000.0)
+        return
+    if resp is None or resp.text != "yes":
+        stats.unlock_ms["rejected"].append((time.perf_counter() - t0) * 1000.0)
+        return
+
+    done = asyncio.Event()
+
+    async def camera():
+        for i in range(args.frames):
+            if done.is_set():
+                return
+            headers = {"X-UID": uid, "Content-Type": "image/jpeg"}
+            if i == args.frames - 1:
+                headers["X-Last-Frame"] = "1"
+            r = await call(client, stats, "recognize", "POST", "/recognize",
+                           content=random.choice(frames), headers=headers)
+            if r is not None and r.text in ("yess", "noo"):
+                return
+            await asyncio.sleep(1.0 / args.fps)
+
+    async def dev():
+        deadline = t0 + args.session_timeout
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(args.poll_interval)
+            r = await call(client, stats, "result", "GET", "/result", params={"uid": uid})
+            if r is not None and r.text in ("yess", "noo"):
+                stats.unlock_ms[r.text].append((time.perf_counter() - t0) * 1000.0)
+                done.set()
+                return
+        stats.unlock_ms["timeout"].append((time.perf_counter() - t0) * 1000.0)
+        done.set()
+
+    await asyncio.gather(camera(), dev())
+
+
+async def door(client, stats, args, door_id, known, frames_by_uid, other_frames, duration, t_start):
+    rng = random.Random(args.seed + door_id)
+    while True:
+        t = time.perf_counter() - t_start
+        rate = arrival_rate(args.pattern, args.swipe_rate, t, duration)
+        await asyncio.sleep(rng.expovariate(rate))
+        if time.perf_counter() - t_start >= duration:
+            return
+        if known and rng.random() >= args.unknown_ratio:
+            uid = rng.choice(known)
+            frames = frames_by_uid[uid]
+        else:
+            uid = f"UNKNOWN{rng.randrange(16 ** 6):06X}"
+            frames = other_frames
+        await run_swipe(client, stats, args, door_id, uid, frames)
+
+
+async def scrape_in_flight(client, stats, stop):
+    """Đọc smartdoor_recognize_in_flight từ /metrics mỗi giây (nếu server có)"""
+    while not stop.is_set():
+        try:
+            r = await client.get("/metrics")
+            for line in r.text.splitlines():
+                if line.startswith("smartdoor_recognize_in_flight "):
+                    stats.in_flight_max = max(stats.in_flight_max, float(line.split()[1]))
+        except httpx.HTTPError:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), 1.0)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_level(args, doors, known, frames_by_uid, other_frames) -> dict:
+    stats = Stats()
+    limits = httpx.Limits(max_connections=doors * 2 + 4)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.request_timeout, limits=limits) as client:
+        stop = asyncio.Event()
+        scraper = asyncio.create_task(scrape_in_flight(client, stats, stop))
+        t_start = time.perf_counter()
+        await asyncio.gather(*(door(client, stats, args, i, known, frames_by_uid, other_frames,
+                                    args.duration, t_start) for i in range(doors)))
+        elapsed = time.perf_counter() - t_start
+        stop.set()
+        await scraper
+    result = stats.summary(elapsed)
+    result["doors"] = doors
+    return result
+
+
+def load_frames(faces_dir: str, extra_dir: str):
+    """Frame của UID known = ảnh đăng ký của chính UID; frame unknown = ảnh trong --frames (hoặc ảnh của UID khác)"""
+    frames_by_uid = {}
+    for path in sorted(glob.glob(os.path.join(faces_dir, "*"))):
+        if path.lower().endswith(IMAGE_EXTS):
+            with open(path, "rb") as f:
+                frames_by_uid[os.path.splitext(os.path.basename(path))[0]] = [f.read()]
+    other = []
+    if extra_dir:
+        for path in sorted(glob.glob(os.path.join(extra_dir, "*"))):
+            if path.lower().endswith(IMAGE_EXTS):
+                with open(path, "rb") as f:
+                    other.append(f.read())
+    if not other:
+        other = [b for frames in frames_by_uid.values() for b in frames]
+    return frames_by_uid, other
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--doors", type=int, default=10)
+    parser.add_argument("--ramp", help="Danh sách số cửa chạy lần lượt, vd 5,10,20,40")
+    parser.add_argument("--duration", type=float, default=60.0, help="Giây mỗi mức tải")
+    parser.add_argument("--pattern", choices=("steady", "morning_rush", "burst"), default="steady")
+    parser.add_argument("--swipe-rate", type=float, default=1 / 30, help="Lượt quẹt/giây mỗi cửa (nền)")
+    parser.add_argument("--unknown-ratio", type=float, default=0.1)
+    parser.add_argument("--fps", type=float, default=2.0, help="Frame/giây của ESP32-CAM")
+    parser.add_argument("--frames", type=int, default=10, help="Số frame tối đa mỗi lượt")
+    parser.add_argument("--poll-interval", type=float, default=0.3)
+    parser.add_argument("--session-timeout", type=float, default=20.0)
+    parser.add_argument("--request-timeout", type=float, default=10.0)
+    parser.add_argument("--faces", default="face_data", help="Ảnh của UID đã đăng ký")
+    parser.add_argument("--frames-dir", help="Ảnh dùng cho UID unknown")
+    parser.add_argument("--slo-ms", type=float, default=3000.0, help="SLO p95 thời gian mở cửa")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    frames_by_uid, other_frames = load_frames(args.faces, args.frames_dir)
+    known = sorted(frames_by_uid)
+    levels = [int(x) for x in args.ramp.split(",")] if args.ramp else [args.doors]
+
+    saturation = None
+    for doors in levels:
+        result = asyncio.run(run_level(args, doors, known, frames_by_uid, other_frames))
+        p95 = max((u["p95_ms"] for k, u in result["unlock"].items() if u and k in ("yess", "noo")),
+                  default=None)
+        result["unlock_p95_ms"] = p95
+        result["within_slo"] = (p95 is None or p95 <= args.slo_ms) and result["error_rate"] <= args.max_error_rate
+        print(json.dumps(result, ensure_ascii=False))
+        if not result["within_slo"] and saturation is None:
+            saturation = doors
+    if args.ramp:
+        print(json.dumps({"saturation_doors": saturation, "slo_ms": args.slo_ms}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""So sánh profile pipeline InsightFace ("verify" vs "full").
+
+Chạy từ thư mục server/:
+
+    python -m bench.pipeline_profile [--images face_data] [--repeat 20]
+
+Mỗi profile được đo trong một process riêng (để RSS không lẫn nhau):
+thời gian face_app.get mỗi frame, RSS sau khi load model, và embedding
+của từng ảnh. Cuối cùng kiểm tra embedding của "verify" trùng từng bit
+với "full".
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from config import IMAGE_EXTS
+
+
+def rss_mb() -> float:
+    """RSS hiện tại của process (MB), đọc từ /proc"""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def list_images(folder: str):
+    return sorted(p for p in glob.glob(os.path.join(folder, "*"))
+                  if p.lower().endswith(IMAGE_EXTS))
+
+
+def run_profile(profile: str, images, repeat: int, out_path: str):
+    """Đo một profile trong process hiện tại, ghi kết quả ra out_path (.npz)"""
+    import cv2
+    from pipeline import create_face_app
+
+    rss_before = rss_mb()
+    t0 = time.perf_counter()
+    face_app = create_face_app(profile=profile, providers=['CPUExecutionProvider'])
+    load_sec = time.perf_counter() - t0
+    rss_loaded = rss_mb()
+
+    frames = [cv2.imread(p) for p in images]
+    names, embeddings, per_frame_ms = [], [], []
+    for path, frame in zip(images, frames):
+        if frame is None:
+            continue
+        face_app.get(frame)  # warmup
+        for _ in range(repeat):
+            t = time.perf_counter()
+            faces = face_app.get(frame)
+            per_frame_ms.append((time.perf_counter() - t) * 1000.0)
+        if faces:
+            names.append(os.path.basename(path))
+            embeddings.append(faces[0].embedding)
+
+    np.savez(out_path,
+             names=np.array(names),
+             embeddings=np.array(embeddings),
+             per_frame_ms=np.array(per_frame_ms),
+             load_sec=load_sec,
+             rss_before=rss_before,
+             rss_loaded=rss_loaded,
+             rss_peak=rss_mb(),
+             modules=np.array(sorted(face_app.models)))
+
+
+def summarize(profile: str, data) -> dict:
+    ms = data["per_frame_ms"]
+    return {
+        "profile": profile,
+        "modules": list(data["modules"]),
+        "load_sec": round(float(data["load_sec"]), 2),
+        "model_rss_mb": round(float(data["rss_loaded"] - data["rss_before"]), 1),
+        "peak_rss_mb": round(float(data["rss_peak"]), 1),
+        "frame_ms_mean": round(float(ms.mean()), 2) if ms.size else None,
+        "frame_ms_p50": round(float(np.percentile(ms, 50)), 2) if ms.size else None,
+        "frame_ms_p95": round(float(np.percentile(ms, 95)), 2) if ms.size else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", default="face_data", help="Thư mục ảnh đầu vào")
+    parser.add_argument("--repeat", type=int, default=20, help="Số lần chạy mỗi ảnh")
+    parser.add_argument("--profiles", default="verify,full")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    images = list_images(args.images)
+    if args.child:
+        run_profile(args.child, images, args.repeat, args.out)
+        return
+    if not images:
+        sys.exit(f"Không có ảnh trong {args.images}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in args.profiles.split(","):
+            out = os.path.join(tmp, f"{profile}.npz")
+            subprocess.run([sys.executable, "-m", "bench.pipeline_profile",
+                            "--images", args.images, "--repeat", str(args.repeat),
+                            "--child", profile, "--out", out],
+                           check=True, stdout=subprocess.DEVNULL)
+            results[profile] = dict(np.load(out))
+
+    for profile, data in results.items():
+        print(json.dumps(summarize(profile, data), ensure_ascii=False))
+
+    if "verify" in results and "full" in results:
+        v, f = results["verify"], results["full"]
+        same_names = list(v["names"]) == list(f["names"])
+        bitwise = same_names and v["embeddings"].tobytes() == f["embeddings"].tobytes()
+        print(json.dumps({"faces": int(len(v["names"])),
+                          "embeddings_bitwise_equal": bool(bitwise)}))
+        if not bitwise:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
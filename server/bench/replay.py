@@ -0,0 +1,188 @@
+"""Replay các frame đã lưu qua pipeline /recognize và đo hiệu năng.
+
+Chạy từ thư mục server/:
+
+    python -m bench.replay --frames uploads --log logs/recognition_log.jsonl
+    python -m bench.replay --stub            # model giả lập, không cần tải buffalo_l
+
+Mỗi frame chạy đúng các bước recognize_face dùng: decode_frame ->
+analyze_frame (detect, chọn mặt đủ chất lượng, tăng sáng vùng mặt, embed) -> match_faces trên
+SharedGallery. Gallery được build từ face_data/ bằng cùng model.
+Frame được ghép với bản ghi log theo tên file để lấy UID và kết quả đã
+log; báo cáo gồm throughput, p50/p95/p99 từng bước và tỉ lệ quyết định
+trùng với log.
+"""
+import argparse
+import glob
+import json
+import os
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+import pipeline
+from config import IMAGE_EXTS, THRESHOLD
+from gallery_store import SharedGallery
+from pipeline import analyze_frame, decode_frame, decode_full, enrollment_embedding, match_faces
+
+
+class StageTimer:
+    """Gom thời gian (ms) từng bước qua nhiều frame"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    @contextmanager
+    def __call__(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, t0)
+
+    def record(self, name: str, t0: float):
+        """Ghi một mẫu từ thời điểm t0 (perf_counter) tới hiện tại"""
+        self.samples[name].append((time.perf_counter() - t0) * 1000.0)
+
+    def report(self) -> dict:
+        out = {}
+        for name, values in self.samples.items():
+            arr = np.array(values)
+            out[name] = {
+                "count": int(arr.size),
+                "mean_ms": round(float(arr.mean()), 3),
+                "p50_ms": round(float(np.percentile(arr, 50)), 3),
+                "p95_ms": round(float(np.percentile(arr, 95)), 3),
+                "p99_ms": round(float(np.percentile(arr, 99)), 3),
+            }
+        return out
+
+
+def basename_any(path: str) -> str:
+    """Tên file từ đường dẫn Windows hoặc POSIX (log cũ ghi đường dẫn Windows)"""
+    return path.replace("\\", "/").rsplit("/", 1)[-1]
+
+
+def load_log(path: str) -> dict:
+    """{tên frame: (uid, matched)} từ recognition_log.jsonl (hỗ trợ cả định dạng log cũ)"""
+    records = {}
+    if not path or not os.path.exists(path):
+        return records
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if not rec.get("image_path"):
+                continue
+            uid = rec.get("uid")
+            if uid is None and rec.get("faces_detail"):
+                uid = rec["faces_detail"][0].get("name")
+            matched = rec.get("matched")
+            if matched is None and "result_sent" in rec:
+                matched = rec["result_sent"] == "yes"
+            records[basename_any(rec["image_path"])] = (uid, matched)
+    return records
+
+
+def build_gallery(face_app, faces_dir: str, state_dir: str, dtype: str) -> SharedGallery:
+    names, embeddings = [], []
+    for fn in sorted(os.listdir(faces_dir)):
+        if not fn.lower().endswith(IMAGE_EXTS):
+            continue
+        img = cv2.imread(os.path.join(faces_dir, fn))
+        if img is None:
+            continue
+        embedding = enrollment_embedding(face_app, img)
+        if embedding is not None:
+            names.append(os.path.splitext(fn)[0])
+            embeddings.append(embedding)
+    gallery = SharedGallery(state_dir, prefix=f"smartdoor_bench_{os.getpid()}", dtype=dtype,
+                            model_id=face_app.model_id)
+    gallery.load_or_build(lambda: (names, np.array(embeddings, np.float32).reshape(-1, gallery.dim)), "bench")
+    return gallery
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", default="uploads", help="Thư mục frame (mặc định *_raw.jpg)")
+    parser.add_argument("--pattern", default="*_raw.jpg")
+    parser.add_argument("--log", default=os.path.join("logs", "recognition_log.jsonl"))
+    parser.add_argument("--faces", default="face_data", help="Thư mục ảnh đăng ký để build gallery")
+    parser.add_argument("--uid", help="UID so khớp cho frame không có trong log")
+    parser.add_argument("--stub", action="store_true", help="Dùng model giả lập (không tải buffalo_l)")
+    parser.add_argument("--profile", default=pipeline.PIPELINE_PROFILE)
+    parser.add_argument("--gallery-dtype", default="float32")
+    parser.add_argument("--limit", type=int, default=0, help="Giới hạn số frame (0 = tất cả)")
+    parser.add_argument("--repeat", type=int, default=1, help="Số lần replay toàn bộ frame")
+    args = parser.parse_args()
+
+    if args.stub:
+        from bench.stub_model import StubFaceApp
+        face_app = StubFaceApp()
+    else:
+        face_app = pipeline.create_face_app(profile=args.profile)
+
+    frames = sorted(glob.glob(os.path.join(args.frames, args.pattern)))
+    if args.limit:
+        frames = frames[:args.limit]
+    log = load_log(args.log)
+    payloads = []
+    for path in frames:
+        with open(path, "rb") as f:
+            payloads.append((os.path.basename(path), f.read()))
+
+    timer = StageTimer()
+    agree = compared = unmatched_uid = undecodable = 0
+    with tempfile.TemporaryDirectory() as state_dir:
+        gallery = build_gallery(face_app, args.faces, state_dir, args.gallery_dtype)
+        try:
+            t_start = time.perf_counter()
+            for _ in range(args.repeat):
+                for name, image_bytes in payloads:
+                    uid, logged = log.get(name, (args.uid, None))
+                    t0 = time.perf_counter()
+                    with timer("decode"):
+                        frame, scale = decode_frame(image_bytes)
+                    if frame is None:
+                        # Frame hỏng không tính vào total/throughput
+                        undecodable += 1
+                        continue
+                    try:
+                        faces, _ = analyze_frame(face_app, frame, stage=timer, scale=scale,
+                                                 full_frame=lambda: decode_full(image_bytes))
+                        with timer("score"):
+                            if uid is None or uid not in gallery:
+                                unmatched_uid += 1
+                                continue
+                            matched, _ = match_faces(faces, gallery, uid, THRESHOLD, face_app.model_id)
+                    finally:
+                        timer.record("total", t0)
+                    if logged is not None:
+                        compared += 1
+                        agree += int(matched == logged)
+            elapsed = time.perf_counter() - t_start
+        finally:
+            gallery.unlink()
+
+    processed = len(timer.samples["total"])
+    print(json.dumps({
+        "model": "stub" if args.stub else f"{pipeline.MODEL_NAME}/{args.profile}",
+        "gallery_size": len(gallery.names),
+        "frames": processed,
+        "throughput_fps": round(processed / elapsed, 2) if elapsed > 0 else None,
+        "stages": timer.report(),
+        "decisions_compared": compared,
+        "decision_agreement": round(agree / compared, 4) if compared else None,
+        "frames_without_known_uid": unmatched_uid,
+        "frames_undecodable": undecodable,
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Model giả lập, thay buffalo_l khi chạy benchmark trên máy CI (không cần tải model).
+
+Có cùng giao diện với FaceAnalysis mà pipeline.py dùng (det_model.detect,
+models["recognition"].get_feat, get). Kết quả hoàn toàn xác định:
+  - detection: một khuôn mặt ở giữa frame, 5 landmark theo tỉ lệ cố định
+  - recognition: ảnh căn chỉnh 112x112 -> xám 32x32 -> chiếu ngẫu nhiên (seed cố định) ra 512 chiều
+Thời gian chạy không đại diện cho model thật, chỉ dùng để kiểm tra pipeline
+và đo phần việc quanh model (decode, căn chỉnh, so khớp, log).
+"""
+import cv2
+import numpy as np
+
+import pipeline
+
+
+class StubDetector:
+    taskname = "detection"
+
+    def detect(self, img, input_size=None, max_num=0, metric="default"):
+        h, w = img.shape[:2]
+        side = 0.5 * min(h, w)
+        x0, y0 = (w - side) / 2, (h - side) / 2
+        bboxes = np.array([[x0, y0, x0 + side, y0 + side, 0.99]], dtype=np.float32)
+        kpss = (pipeline.CROP_KPS_TEMPLATE * side + np.array([x0, y0], dtype=np.float32))[None]
+        return bboxes, kpss
+
+
+class StubRecognizer:
+    taskname = "recognition"
+    input_size = (112, 112)
+
+    def __init__(self, seed: int = 0):
+        self.projection = np.random.default_rng(seed).standard_normal((32 * 32, 512)).astype(np.float32)
+
+    def get_feat(self, imgs):
+        if not isinstance(imgs, list):
+            imgs = [imgs]
+        feats = []
+        for img in imgs:
+            gray = cv2.resize(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), (32, 32), interpolation=cv2.INTER_AREA)
+            x = gray.astype(np.float32).ravel()
+            x = (x - x.mean()) / (x.std() + 1e-6)
+            feats.append(x @ self.projection)
+        return np.stack(feats)
+
+
+class StubFaceApp:
+    def __init__(self, seed: int = 0):
+        self.model_id = "stub"
+        self.det_model = StubDetector()
+        self.models = {"detection": self.det_model, "recognition": StubRecognizer(seed)}
+
+    def get(self, img, max_num=0):
+        faces = pipeline.detect_faces(self, img)
+        for face in faces:
+            pipeline.embed_face(self, img, face, brighten=False)
+        return faces
@@ -0,0 +1,177 @@
+import mmap
+import os
+import secrets
+import threading
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse
+
+from metrics import stage
+
+MAX_FRAME_BYTES = int(os.getenv("MAX_FRAME_BYTES", str(2 * 1024 * 1024)))    # Frame JPEG từ ESP32-CAM
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))  # Ảnh đăng ký
+MAX_CROP_BYTES = int(os.getenv("MAX_CROP_BYTES", str(256 * 1024)))  # Ảnh mặt crop sẵn trên camera
+UPLOAD_CHUNK = 64 * 1024
+
+# Magic bytes -> loại ảnh, và đuôi file hợp lệ cho từng loại
+IMAGE_MAGIC = ((b"\xff\xd8\xff", "jpeg"), (b"\x89PNG\r\n\x1a\n", "png"))
+IMAGE_EXT_TYPES = {".jpg": "jpeg", ".jpeg": "jpeg", ".png": "png"}
+IMAGE_CONTENT_TYPES = {"image/jpeg": "jpeg", "image/jpg": "jpeg", "image/png": "png"}
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    for magic, kind in IMAGE_MAGIC:
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+def declared_length(request: Request) -> Optional[int]:
+    value = request.headers.get("content-length")
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class FrameBufferPool:
+    """Bộ đệm dùng lại cho body /recognize, mỗi bộ đệm có dung lượng cố định max_bytes.
+
+    Dung lượng cố định nên không bao giờ phải cấp phát lại hay resize khi
+    đang có view (np.frombuffer) trỏ vào. Bộ đệm là vùng mmap ẩn danh nên
+    OS chỉ cấp trang nhớ khi ghi tới (bytearray(max_bytes) sẽ zero-fill và
+    chiếm đủ max_bytes ngay): mỗi bộ đệm chỉ tốn RAM bằng body lớn nhất nó
+    từng nhận. Giữ lại tối đa size bộ đệm rảnh, nên chọn cỡ số request
+    đồng thời mỗi worker.
+    """
+
+    def __init__(self, max_bytes: int = MAX_FRAME_BYTES, size: int = 8):
+        self.max_bytes = max_bytes
+        self.size = size
+        self._free = []
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> mmap.mmap:
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+        return mmap.mmap(-1, self.max_bytes)
+
+    def _release(self, buf: mmap.mmap):
+        with self._lock:
+            if len(self._free) < self.size:
+                self._free.append(buf)
+
+    @asynccontextmanager
+    async def read(self, request: Request):
+        """Đọc body vào bộ đệm, trả về memoryview phần đã đọc; BodyTooLarge nếu vượt max_bytes"""
+        length = declared_length(request)
+        if length is not None and length > self.max_bytes:
+            raise BodyTooLarge(length)
+
+        buf = self._acquire()
+        try:
+            n = 0
+            with stage("body_read"):
+                async for chunk in request.stream():
+                    end = n + len(chunk)
+                    if end > self.max_bytes:
+                        raise BodyTooLarge(end)
+                    buf[n:end] = chunk
+                    n = end
+            yield memoryview(buf)[:n]
+        finally:
+            self._release(buf)
+
+
+class BodyLimitMiddleware:
+    """Chặn body quá max_bytes ở các path cho trước, trước khi app đọc body.
+
+    Cần cho upload multipart: Starlette nhận và spool cả file trước khi
+    handler chạy, nên giới hạn trong save_upload_image đến quá muộn.
+    Content-Length vượt giới hạn -> 413 ngay; không có Content-Length
+    (chunked) thì đếm byte khi nhận, vượt thì dừng đọc và trả 413.
+    """
+
+    def __init__(self, app, max_bytes: int, paths=()):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        response = JSONResponse({"detail": f"Request vượt quá {self.max_bytes // (1024 * 1024)} MB"},
+                                status_code=413)
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            await response(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise BodyTooLarge(received)
+            return message
+
+        async def guarded_send(message):
+            # Body quá lớn: bỏ response của app (FastAPI đổi lỗi đọc form thành 400), trả 413
+            if not exceeded:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except BodyTooLarge:
+            pass
+        if exceeded:
+            await response(scope, receive, send)
+
+
+async def save_upload_image(file: UploadFile, dest_path: str, max_bytes: int = MAX_UPLOAD_BYTES) -> str:
+    """Ghi ảnh upload xuống đĩa theo từng chunk rồi rename nguyên tử.
+
+    Kiểm tra content-type, magic bytes khớp đuôi file và giới hạn dung lượng;
+    lỗi -> HTTPException (400/413). Trả về loại ảnh ("jpeg"/"png").
+    """
+    expected = IMAGE_EXT_TYPES.get(os.path.splitext(dest_path)[1].lower())
+    content_type = (file.content_type or "").split(";")[0].strip().lower()
+    if content_type in IMAGE_CONTENT_TYPES and IMAGE_CONTENT_TYPES[content_type] != expected:
+        raise HTTPException(status_code=400, detail="Content-Type không khớp đuôi file")
+    if content_type and content_type not in IMAGE_CONTENT_TYPES and content_type != "application/octet-stream":
+        raise HTTPException(status_code=400, detail="Chỉ hỗ trợ ảnh JPG/PNG")
+
+    head = await file.read(UPLOAD_CHUNK)
+    kind = sniff_image_type(head)
+    if kind is None or kind != expected:
+        raise HTTPException(status_code=400, detail="Nội dung file không phải ảnh JPG/PNG hợp lệ")
+
+    tmp_path = f"{dest_path}.{secrets.token_hex(6)}.tmp"
+    written = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            chunk = head
+            while chunk:
+                written += len(chunk)
+                if written > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"Ảnh vượt quá {max_bytes // (1024 * 1024)} MB")
+                f.write(chunk)
+                chunk = await file.read(UPLOAD_CHUNK)
+        os.replace(tmp_path, dest_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return kind
@@ -0,0 +1,44 @@
+"""Cấu hình chung cho inference app và admin app (không import model/OpenCV)"""
+import os
+
+# Thư mục
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FACE_FOLDER = os.path.join(BASE_DIR, "face_data")
+UPLOAD_FOLDER = os.path.join(BASE_DIR, "uploads")
+LOG_FOLDER = os.path.join(BASE_DIR, "logs")
+STATE_DIR = os.path.join(BASE_DIR, "state")  # Trạng thái dùng chung giữa các worker/process
+GALLERY_ROOT = os.path.join(BASE_DIR, "galleries")  # Gallery đã embed sẵn theo từng model (xem reembed.py)
+WIFI_CONFIG_FILE = os.path.join(BASE_DIR, "wifi.json")
+TEMPLATE_DIR = os.path.join(BASE_DIR, "templates")
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")  # Ảnh đăng ký (face_data/) và frame (uploads/)
+
+# Vai trò process: "inference" (cửa: /precheck, /recognize, /result), "admin" (trang quản trị)
+# hoặc "all" (cả hai trong một process như trước)
+APP_ROLES = ("all", "inference", "admin")
+APP_ROLE = os.getenv("APP_ROLE", "all")
+APP_PORT = int(os.getenv("APP_PORT", "5001" if APP_ROLE == "admin" else "5000"))
+WORKERS = int(os.getenv("WORKERS", "1"))  # Số worker uvicorn (chỉ inference/all)
+
+# Model pack InsightFace (có thể đổi sang 'buffalo_s' nếu cần nhanh hơn)
+MODEL_NAME = os.getenv("FACE_MODEL", "buffalo_l")
+GALLERY_DTYPE = os.getenv("GALLERY_DTYPE", "float32")  # float32 / float16 / int8 (xem bench/gallery_precision.py)
+SESSION_TTL_SEC = 45
+THRESHOLD = 0.45  # Ngưỡng tương đồng (cosine similarity, cao hơn = giống hơn)
+
+# /precheck: giới hạn mỗi thiết bị (X-Device-ID, không có thì IP; chỉ với UID chưa có trong gallery)
+# và thời gian nhớ UID không đăng ký
+PRECHECK_RATE = float(os.getenv("PRECHECK_RATE", "2"))  # request/giây
+PRECHECK_BURST = int(os.getenv("PRECHECK_BURST", "5"))
+UNKNOWN_UID_TTL_SEC = float(os.getenv("UNKNOWN_UID_TTL_SEC", "30"))
+
+# Tự giảm tải khi quá tải (xem degrade.py): SLO latency /recognize, số request chờ tối đa,
+# model pack nhẹ cho mức thấp nhất (cần gallery version: python reembed.py --model <pack>)
+DEGRADE = os.getenv("DEGRADE", "1") == "1"
+RECOGNIZE_SLO_MS = float(os.getenv("RECOGNIZE_SLO_MS", "1500"))
+DEGRADE_MAX_QUEUE = int(os.getenv("DEGRADE_MAX_QUEUE", "4"))
+DEGRADE_MODEL = os.getenv("DEGRADE_MODEL", "")
+
+UPLOAD_PASSWORD = "123456"
+ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", UPLOAD_PASSWORD)  # Cho các endpoint /admin/*
+PROFILE_MAX_SEC = 300  # Giới hạn thời gian một lần profile
+WIFI_PANEL_PASSWORD = "adminwifi"
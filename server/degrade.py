@@ -0,0 +1,63 @@
+import time
+from collections import deque
+
+import metrics
+
+# Các mức giảm tải, mức sau rẻ hơn mức trước:
+#   det_size: kích thước input SCRFD (bội số của 32), cũng dùng để decode thu nhỏ frame
+#   sample: mỗi session chỉ xử lý 1/sample frame (frame cuối luôn được xử lý)
+#   light_model: dùng model pack nhẹ (DEGRADE_MODEL) nếu đã có gallery version cho nó
+DEGRADE_LEVELS = (
+    {"det_size": (640, 640), "sample": 1, "light_model": False},
+    {"det_size": (480, 480), "sample": 1, "light_model": False},
+    {"det_size": (320, 320), "sample": 1, "light_model": False},
+    {"det_size": (320, 320), "sample": 2, "light_model": False},
+    {"det_size": (320, 320), "sample": 2, "light_model": True},
+)
+
+
+class DegradationController:
+    """Chọn mức giảm tải theo latency /recognize gần đây và số request đang chờ so với SLO.
+
+    p95 của window request gần nhất vượt SLO (hoặc hàng đợi quá max_queue)
+    thì giảm một mức; p95 dưới recover_ratio x SLO và hàng đợi trống thì
+    tăng lại một mức. Sau mỗi lần đổi mức phải chờ cooldown_sec và đủ
+    min_samples request đo ở mức mới. Mỗi worker tự điều khiển mức của nó.
+    """
+
+    def __init__(self, slo_ms: float, max_queue: int, levels=DEGRADE_LEVELS, window: int = 50,
+                 min_samples: int = 10, cooldown_sec: float = 5.0, recover_ratio: float = 0.5):
+        self.slo_ms = slo_ms
+        self.max_queue = max_queue
+        self.levels = levels
+        self.max_level = len(levels) - 1
+        self.min_samples = min_samples
+        self.cooldown_sec = cooldown_sec
+        self.recover_ratio = recover_ratio
+        self.level = 0
+        self._latencies = deque(maxlen=window)
+        self._changed_at = 0.0
+        metrics.DEGRADE_LEVEL.set(0)
+
+    def current(self) -> dict:
+        return self.levels[self.level]
+
+    def observe(self, latency_ms: float, queue_depth: int):
+        self._latencies.append(latency_ms)
+        if (len(self._latencies) < self.min_samples
+                or time.monotonic() - self._changed_at < self.cooldown_sec):
+            return
+        ordered = sorted(self._latencies)
+        p95 = ordered[int(0.95 * (len(ordered) - 1))]
+        if (p95 > self.slo_ms or queue_depth > self.max_queue) and self.level < self.max_level:
+            self._set(self.level + 1, p95, queue_depth)
+        elif p95 < self.slo_ms * self.recover_ratio and queue_depth <= 1 and self.level > 0:
+            self._set(self.level - 1, p95, queue_depth)
+
+    def _set(self, level: int, p95: float, queue_depth: int):
+        print(f"[Degrade] Mức {self.level} -> {level} (p95 {p95:.0f}ms, SLO {self.slo_ms:.0f}ms, "
+              f"hàng đợi {queue_depth}): {self.levels[level]}")
+        self.level = level
+        self._latencies.clear()
+        self._changed_at = time.monotonic()
+        metrics.DEGRADE_LEVEL.set(level)
@@ -0,0 +1,49 @@
+import os
+import threading
+import time
+
+
+class EnrollmentQueue:
+    """UID vừa upload ảnh đăng ký, chờ inference app embed.
+
+    Admin app không có model nên chỉ ghi file đánh dấu state/enroll/<uid>;
+    inference app quét thư mục này và embed. Nhiều worker cùng quét thì
+    worker nào xóa được file đánh dấu trước sẽ nhận UID đó.
+    """
+
+    def __init__(self, folder: str, poll_sec: float = 1.0):
+        self.folder = folder
+        self.poll_sec = poll_sec
+        self._thread = None
+        os.makedirs(folder, exist_ok=True)
+
+    def mark(self, uid: str):
+        with open(os.path.join(self.folder, uid), "w"):
+            pass
+
+    def pending(self) -> list:
+        return sorted(os.listdir(self.folder))
+
+    def claim(self, uid: str) -> bool:
+        try:
+            os.remove(os.path.join(self.folder, uid))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def start(self, embed):
+        """Chạy thread nền gọi embed(uid) cho từng UID đang chờ"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(embed,), name="enrollment", daemon=True)
+            self._thread.start()
+
+    def _run(self, embed):
+        while True:
+            for uid in self.pending():
+                if not self.claim(uid):
+                    continue
+                try:
+                    embed(uid)
+                except Exception as e:
+                    print(f"[Enroll] Lỗi embed {uid}: {e}")
+            time.sleep(self.poll_sec)
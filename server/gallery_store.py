@@ -0,0 +1,326 @@
+import fcntl
+import json
+import os
+import secrets
+import threading
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+# Segment dữ liệu nằm trên tmpfs (/dev/shm) để mọi worker map chung một bản trong RAM
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# Kiểu lưu embedding: float32 (gốc), float16 (1/2 RAM) hoặc int8 + scale mỗi vector (1/4 RAM)
+GALLERY_DTYPES = ("float32", "float16", "int8")
+# Số dòng upcast sang float32 mỗi lần khi chấm điểm cả gallery (giới hạn RAM tạm)
+SCORE_CHUNK_ROWS = 65536
+
+
+def quantize(embeddings, dtype: str):
+    """Chuyển embedding float32 sang dạng lưu trữ, trả về (data, scales); scales=None nếu không phải int8"""
+    embeddings = np.asarray(embeddings, np.float32)
+    if dtype == "int8":
+        scales = np.abs(embeddings).max(axis=-1) / 127.0
+        scales[scales == 0] = 1.0
+        data = np.clip(np.rint(embeddings / scales[..., None]), -127, 127).astype(np.int8)
+        return data, scales.astype(np.float32)
+    return embeddings.astype(dtype), None
+
+
+def dequantize(data, scales=None):
+    out = np.asarray(data, dtype=np.float32)
+    if scales is not None:
+        out = out * np.asarray(scales, np.float32)[..., None]
+    return out
+
+
+def score_block(data, scales, queries):
+    """Cosine similarity giữa các dòng gallery (dạng nén) và queries đã chuẩn hóa L2"""
+    out = np.empty((data.shape[0], queries.shape[0]), np.float32)
+    for start in range(0, data.shape[0], SCORE_CHUNK_ROWS):
+        end = start + SCORE_CHUNK_ROWS
+        block = np.asarray(data[start:end]).astype(np.float32, copy=False)
+        np.matmul(block, queries.T, out=out[start:end])
+        if scales is not None:
+            out[start:end] *= np.asarray(scales[start:end])[:, None]
+    return out
+
+
+class GallerySnapshot(NamedTuple):
+    """Một version gallery đã map; thay cả khối bằng một phép gán nên người đọc không thấy trạng thái lẫn"""
+    version: int
+    names: list
+    index: dict
+    data: np.ndarray
+    scales: Optional[np.ndarray]
+
+
+class SharedGallery:
+    """Gallery embedding chỉ-đọc, dùng chung giữa các worker uvicorn.
+
+    Mỗi gallery thuộc một không gian embedding (model_id); manifest của model
+    khác bị bỏ qua và không bao giờ so khớp chéo giữa hai model.
+
+    Embedding nằm trong một segment trên /dev/shm, mỗi worker map bằng
+    np.memmap (không copy). Một manifest JSON trỏ tới segment hiện tại;
+    khi gallery thay đổi, worker ghi tạo segment mới, tăng version và thay
+    manifest nguyên tử (os.replace). Các worker khác thấy manifest đổi
+    và map lại. Mọi thao tác ghi đi qua một file lock.
+
+    Trong một process, version đang map là một GallerySnapshot bất biến:
+    thao tác đọc lấy snapshot một lần rồi dùng nó đến hết, nên thread nền
+    (đăng ký UID) upsert/remove không làm lệch index với data. Map lại
+    được tuần tự hóa bằng một lock.
+    """
+
+    def __init__(self, state_dir: str, prefix: str = "smartdoor_gallery", dim: int = 512,
+                 dtype: str = "float32", model_id: str = ""):
+        if dtype not in GALLERY_DTYPES:
+            raise ValueError(f"Kiểu gallery không hợp lệ: {dtype} (chọn: {', '.join(GALLERY_DTYPES)})")
+        self.state_dir = state_dir
+        self.dtype = dtype
+        self.model_id = model_id
+        self.shm_dir = SHM_DIR or state_dir
+        self.prefix = prefix
+        self.dim = dim
+        self.manifest_path = os.path.join(state_dir, f"{prefix}.json")
+        self.lock_path = os.path.join(state_dir, f"{prefix}.lock")
+        self._snap = GallerySnapshot(-1, [], {}, np.empty((0, dim), dtype),
+                                     np.empty((0,), np.float32) if dtype == "int8" else None)
+        self._manifest_key = None
+        self._attach_lock = threading.RLock()
+
+    @property
+    def version(self) -> int:
+        return self._snap.version
+
+    @property
+    def names(self) -> list:
+        return self._snap.names
+
+    @property
+    def data(self):
+        return self._snap.data
+
+    @property
+    def scales(self):
+        return self._snap.scales
+
+    def snapshot(self) -> GallerySnapshot:
+        """Version mới nhất (refresh nếu cần); dùng một snapshot cho cả thao tác đọc"""
+        self.refresh()
+        return self._snap
+
+    def __len__(self):
+        return len(self.snapshot().names)
+
+    def __contains__(self, uid):
+        return uid in self.snapshot().index
+
+    # ----- Đọc -----
+    def _read_manifest(self) -> Optional[dict]:
+        try:
+            with open(self.manifest_path, "r", encoding="utf8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _attach(self, manifest: dict) -> bool:
+        if manifest.get("model_id", "") != self.model_id:
+            return False
+        count, dim, dtype = manifest["count"], manifest["dim"], manifest["dtype"]
+        scales = None
+        if count:
+            path = os.path.join(self.shm_dir, manifest["segment"])
+            try:
+                data = np.memmap(path, dtype=dtype, mode="r", shape=(count, dim))
+                if manifest.get("scales_offset") is not None:
+                    scales = np.memmap(path, dtype=np.float32, mode="r", shape=(count,),
+                                       offset=manifest["scales_offset"])
+            except (OSError, ValueError):
+                return False
+        else:
+            data = np.empty((0, dim), dtype)
+            if dtype == "int8":
+                scales = np.empty((0,), np.float32)
+        names = manifest["names"]
+        self._snap = GallerySnapshot(manifest["version"], names, {uid: i for i, uid in enumerate(names)},
+                                     data, scales)
+        return True
+
+    def _stat_key(self):
+        try:
+            st = os.stat(self.manifest_path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def refresh(self):
+        """Map lại nếu worker khác đã publish version mới (bình thường chỉ tốn 1 lần stat)"""
+        key = self._stat_key()
+        if key is None or key == self._manifest_key:
+            return
+        with self._attach_lock:
+            if key == self._manifest_key:
+                return
+            manifest = self._read_manifest()
+            if manifest is None:
+                return
+            if manifest["version"] == self._snap.version or self._attach(manifest):
+                self._manifest_key = key
+
+    def get(self, uid: str):
+        """Embedding float32 của UID, None nếu chưa có"""
+        snap = self.snapshot()
+        idx = snap.index.get(uid)
+        if idx is None:
+            return None
+        return dequantize(snap.data[idx], None if snap.scales is None else snap.scales[idx])
+
+    def check_model(self, model_id: Optional[str]):
+        """Chặn so khớp embedding của model khác với gallery"""
+        if model_id is not None and model_id != self.model_id:
+            raise ValueError(f"Embedding của model {model_id} không so khớp được với gallery {self.model_id}")
+
+    def similarity(self, uid: str, queries, model_id: Optional[str] = None):
+        """Cosine similarity giữa UID và từng query (đã chuẩn hóa), tính thẳng trên dạng nén"""
+        self.check_model(model_id)
+        snap = self.snapshot()
+        idx = snap.index.get(uid)
+        if idx is None:
+            return None
+        queries = np.asarray(queries, np.float32).reshape(-1, self.dim)
+        scales = None if snap.scales is None else snap.scales[idx:idx + 1]
+        return score_block(snap.data[idx:idx + 1], scales, queries)[0]
+
+    def search(self, query, top_k: int = 1, model_id: Optional[str] = None):
+        """Tìm top_k UID giống query nhất trong toàn bộ gallery: [(uid, similarity), ...]"""
+        self.check_model(model_id)
+        snap = self.snapshot()
+        if not snap.names:
+            return []
+        query = np.asarray(query, np.float32).reshape(1, self.dim)
+        sims = score_block(snap.data, snap.scales, query)[:, 0]
+        top_k = min(top_k, sims.shape[0])
+        top = np.argpartition(-sims, top_k - 1)[:top_k]
+        top = top[np.argsort(-sims[top])]
+        return [(snap.names[i], float(sims[i])) for i in top]
+
+    # ----- Ghi -----
+    @contextmanager
+    def _locked(self):
+        # File lock giữa các process (mỗi lần mở là một open file description nên cũng chặn giữa
+        # các thread), kèm lock map lại của process này
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with self._attach_lock:
+                    yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _publish(self, names, data, scales, previous: Optional[dict], boot_id: Optional[str] = None):
+        """Ghi segment mới (data, rồi scales nếu int8) và thay manifest"""
+        version = previous["version"] + 1 if previous else 0
+        segment = f"{self.prefix}_{version}_{secrets.token_hex(4)}"
+        data = np.ascontiguousarray(data, dtype=self.dtype).reshape(-1, self.dim)
+        with open(os.path.join(self.shm_dir, segment), "wb") as f:
+            f.write(data.tobytes())
+            if scales is not None:
+                f.write(np.ascontiguousarray(scales, dtype=np.float32).tobytes())
+
+        manifest = {
+            "version": version,
+            "segment": segment,
+            "count": len(names),
+            "dim": self.dim,
+            "dtype": self.dtype,
+            "model_id": self.model_id,
+            "scales_offset": data.nbytes if scales is not None else None,
+            "names": list(names),
+            "boot": boot_id if boot_id is not None else (previous or {}).get("boot"),
+        }
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+        # Worker khác đang map segment cũ vẫn đọc được sau khi unlink
+        if previous:
+            try:
+                os.remove(os.path.join(self.shm_dir, previous["segment"]))
+            except OSError:
+                pass
+        self._attach(manifest)
+        self._manifest_key = self._stat_key()
+
+    def _current(self) -> Optional[dict]:
+        """Đọc manifest mới nhất (gọi khi đang giữ lock) và map theo nó"""
+        manifest = self._read_manifest()
+        if manifest and manifest["version"] != self._snap.version:
+            self._attach(manifest)
+        return manifest
+
+    def upsert(self, uid: str, embedding, model_id: Optional[str] = None):
+        self.check_model(model_id)
+        with self._locked():
+            manifest = self._current()
+            snap = self._snap
+            names = list(snap.names)
+            row, row_scale = quantize(np.asarray(embedding, np.float32).reshape(1, self.dim), self.dtype)
+            # Chỉ lượng tử hóa dòng mới, các dòng cũ giữ nguyên bytes
+            data = np.array(snap.data).reshape(-1, self.dim)
+            scales = None if snap.scales is None else np.array(snap.scales)
+            idx = snap.index.get(uid)
+            if idx is not None:
+                data[idx] = row[0]
+                if scales is not None:
+                    scales[idx] = row_scale[0]
+            else:
+                names.append(uid)
+                data = np.concatenate([data, row])
+                if scales is not None:
+                    scales = np.concatenate([scales, row_scale])
+            self._publish(names, data, scales, manifest)
+
+    def remove(self, uid: str) -> bool:
+        with self._locked():
+            manifest = self._current()
+            snap = self._snap
+            idx = snap.index.get(uid)
+            if idx is None:
+                return False
+            names = snap.names[:idx] + snap.names[idx + 1:]
+            data = np.delete(np.asarray(snap.data), idx, axis=0)
+            scales = None if snap.scales is None else np.delete(np.asarray(snap.scales), idx)
+            self._publish(names, data, scales, manifest)
+            return True
+
+    def unlink(self):
+        """Xóa manifest và segment hiện tại (dùng cho tool/benchmark chạy với state tạm)"""
+        with self._locked():
+            manifest = self._read_manifest()
+            for path in (os.path.join(self.shm_dir, manifest["segment"]) if manifest else None,
+                         self.manifest_path):
+                if path:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def load_or_build(self, build, boot_id: str) -> bool:
+        """Map gallery của lần khởi động hiện tại; nếu chưa có thì worker đầu tiên gọi build()
+
+        build() trả về (names, embeddings float32). Trả về True nếu gallery vừa được build.
+        """
+        with self._locked():
+            manifest = self._read_manifest()
+            if (manifest and manifest.get("boot") == boot_id and manifest["dtype"] == self.dtype
+                    and self._attach(manifest)):  # _attach từ chối manifest của model khác
+                self._manifest_key = self._stat_key()
+                return False
+            names, embeddings = build()
+            data, scales = quantize(np.asarray(embeddings, np.float32).reshape(-1, self.dim), self.dtype)
+            self._publish(names, data, scales, manifest, boot_id)
+            return True
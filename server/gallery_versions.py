@@ -0,0 +1,85 @@
+import json
+import os
+import time
+from typing import Optional
+
+import numpy as np
+
+from config import IMAGE_EXTS
+
+
+def version_path(root: str, model_id: str) -> str:
+    """Mỗi không gian embedding (model) có một file gallery riêng: <root>/<model_id>/gallery.npz"""
+    return os.path.join(root, model_id, "gallery.npz")
+
+
+def scan_sources(face_dir: str) -> dict:
+    """{uid: [tên file, size, mtime_ns]} của các ảnh đăng ký trong face_data/"""
+    sources = {}
+    with os.scandir(face_dir) as it:
+        for entry in sorted(it, key=lambda e: e.name):
+            if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTS):
+                st = entry.stat()
+                sources[os.path.splitext(entry.name)[0]] = [entry.name, st.st_size, st.st_mtime_ns]
+    return sources
+
+
+def load_version(root: str, model_id: str) -> Optional[dict]:
+    """Đọc gallery đã embed sẵn cho model_id, None nếu chưa có hoặc không khớp model"""
+    path = version_path(root, model_id)
+    try:
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("model_id") != model_id:
+                return None
+            return {
+                "model_id": model_id,
+                "names": [str(n) for n in data["names"]],
+                "embeddings": data["embeddings"].astype(np.float32),
+                "sources": meta["sources"],
+                "created": meta.get("created"),
+            }
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def save_version(root: str, model_id: str, names, embeddings, sources: dict):
+    """Ghi gallery version (tmp + os.replace, không để lại file dở dang)"""
+    path = version_path(root, model_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    meta = {"model_id": model_id, "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "sources": sources}
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path,
+             names=np.array(list(names), dtype=str),
+             embeddings=np.asarray(embeddings, np.float32).reshape(len(names), -1) if len(names)
+             else np.empty((0, 512), np.float32),
+             meta=np.array(json.dumps(meta, ensure_ascii=False)))
+    os.replace(tmp_path, path)
+
+
+def reconcile(version: Optional[dict], sources: dict, embed):
+    """Dùng lại embedding của ảnh không đổi, chỉ gọi embed(tên file) cho ảnh mới/đã sửa.
+
+    Trả về (names, embeddings, changed). Ảnh không có mặt vẫn được ghi trong
+    sources nên lần sau không bị embed lại.
+    """
+    old_index = {}
+    old_sources = {}
+    if version:
+        old_index = {uid: i for i, uid in enumerate(version["names"])}
+        old_sources = version["sources"]
+
+    names, embeddings = [], []
+    changed = version is None or set(old_sources) != set(sources)
+    for uid, source in sources.items():
+        if old_sources.get(uid) == source:
+            if uid in old_index:
+                names.append(uid)
+                embeddings.append(version["embeddings"][old_index[uid]])
+            continue
+        changed = True
+        embedding = embed(source[0])
+        if embedding is not None:
+            names.append(uid)
+            embeddings.append(np.asarray(embedding, np.float32))
+    return names, embeddings, changed
@@ -0,0 +1,470 @@
+"""Inference app: các endpoint của cửa (/precheck, /recognize, /result), metrics và profiler.
+
+Chỉ process này nạp InsightFace. Ảnh đăng ký do admin app upload được
+embed qua hàng đợi đăng ký (thread nền) hoặc ngay khi /precheck gặp UID
+chưa có trong gallery.
+"""
+import asyncio
+import json
+import os
+import secrets
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+import cv2
+import numpy as np
+from fastapi import APIRouter, FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, Response
+
+import metrics
+from body_limits import MAX_CROP_BYTES, BodyTooLarge, FrameBufferPool
+from config import (ADMIN_PASSWORD, DEGRADE, DEGRADE_MAX_QUEUE, DEGRADE_MODEL, FACE_FOLDER, GALLERY_DTYPE,
+                    GALLERY_ROOT, LOG_FOLDER, MODEL_NAME, PRECHECK_BURST, PRECHECK_RATE, PROFILE_MAX_SEC,
+                    RECOGNIZE_SLO_MS, SESSION_TTL_SEC, STATE_DIR, THRESHOLD, UPLOAD_FOLDER)
+from degrade import DegradationController
+from gallery_store import SharedGallery
+from gallery_versions import load_version, reconcile, save_version, scan_sources
+from metrics import stage
+from pipeline import (PIPELINE_PROFILE, analyze_crop, analyze_frame, create_face_app, decode_frame, decode_full,
+                      enrollment_embedding, match_faces)
+from profiler import SamplingProfiler
+from rate_limit import RateLimiter
+from session_store import SessionStore
+from shared import enrollments, face_gallery, uid_directory, upload_index
+
+router = APIRouter()
+
+# Session (SQLite WAL), dùng chung giữa các worker
+active_sessions = SessionStore(os.path.join(STATE_DIR, "sessions.db"), SESSION_TTL_SEC)
+
+# Giới hạn /precheck theo thiết bị (UID -> ảnh đăng ký: shared.uid_directory)
+precheck_limiter = RateLimiter(PRECHECK_RATE, PRECHECK_BURST)
+
+# Bộ đệm dùng lại cho body frame /recognize (giới hạn MAX_FRAME_BYTES)
+frame_buffers = FrameBufferPool()
+crop_buffers = FrameBufferPool(MAX_CROP_BYTES)
+
+# InsightFace được khởi tạo khi worker start (xem startup())
+face_app = None
+
+# Giảm tải theo SLO; model pack nhẹ + gallery của nó chỉ nạp khi có DEGRADE_MODEL và gallery version
+degrader = DegradationController(RECOGNIZE_SLO_MS, DEGRADE_MAX_QUEUE)
+light_app = None
+light_gallery = None
+recognize_queue = 0  # Số request /recognize đang xử lý (worker này)
+
+
+def install(app: FastAPI):
+    """Gắn các route của cửa và khởi tạo model khi worker start"""
+    app.include_router(router)
+    app.on_event("startup")(startup)
+
+def cleanup_sessions():
+    """Xóa các session hết hạn (session còn pending tính là timeout)"""
+    for frames in active_sessions.cleanup():
+        metrics.record_decision("timeout", frames)
+
+def finish_session(uid: str, status: str, frames: int = 0) -> PlainTextResponse:
+    """Chốt kết quả session (yess/noo) và ghi nhận metrics
+
+    Worker khác đã chốt trước thì trả về kết quả của nó và không đếm lại.
+    """
+    stored, won = active_sessions.finish(uid, status)
+    if won:
+        metrics.record_decision(status, frames)
+    return PlainTextResponse(stored or status)
+
+def extract_embedding(image_path: str):
+    """Trích xuất embedding từ ảnh sử dụng InsightFace"""
+    try:
+        img = cv2.imread(image_path)
+        if img is None:
+            return None
+        
+        # Detect và lấy embedding (đã chuẩn hóa L2)
+        embedding = enrollment_embedding(face_app, img)
+        if embedding is None:
+            print(f"[Warning] Không phát hiện khuôn mặt trong {image_path}")
+        return embedding
+    except Exception as e:
+        print(f"[Error] Lỗi trích xuất embedding: {e}")
+        return None
+
+def gallery_uid(uid: str) -> str:
+    """Khóa gallery của UID: tên file ảnh trong face_data/ (thẻ gửi UID không phân biệt hoa thường)"""
+    if uid in face_gallery:
+        return uid
+    return uid_directory.name(uid) or uid
+
+def load_uid_encoding(uid: str):
+    """Đọc/đệm embedding cho UID (UID không đăng ký được nhớ trong negative cache)"""
+    if uid_directory.is_negative(uid):
+        return None
+    embedding = face_gallery.get(uid)
+    if embedding is not None:
+        return embedding
+    
+    name = uid_directory.name(uid)
+    if not name:
+        uid_directory.mark_negative(uid)
+        return None
+    embedding = face_gallery.get(name)
+    if embedding is not None:
+        return embedding
+    
+    embedding = extract_embedding(uid_directory.path(name))
+    if embedding is not None:
+        face_gallery.upsert(name, embedding, model_id=face_app.model_id)
+    else:
+        uid_directory.mark_negative(uid)  # Ảnh không có mặt: không embed lại mỗi lần quẹt thẻ
+    return embedding
+
+
+
+def build_known_faces():
+    """Embedding các khuôn mặt đã biết: dùng gallery version của model hiện tại, chỉ embed ảnh mới/đã sửa"""
+    print(f"[Load] Đang load face database ({MODEL_NAME})...")
+    version = load_version(GALLERY_ROOT, MODEL_NAME)
+    if version:
+        print(f"[Load] Dùng gallery version {MODEL_NAME} tạo lúc {version['created']}")
+    sources = scan_sources(FACE_FOLDER)
+    
+    def embed(file):
+        embedding = extract_embedding(os.path.join(FACE_FOLDER, file))
+        if embedding is not None:
+            print(f"  ✓ Loaded: {os.path.splitext(file)[0]}")
+        return embedding
+    
+    known_face_names, known_face_embeddings, changed = reconcile(version, sources, embed)
+    if changed:
+        save_version(GALLERY_ROOT, MODEL_NAME, known_face_names, known_face_embeddings, sources)
+    
+    print(f"[Load] Hoàn tất! Tổng {len(known_face_names)} khuôn mặt")
+    return known_face_names, known_face_embeddings
+
+def boot_id() -> str:
+    return os.getenv("SMARTDOOR_BOOT_ID") or str(os.getppid())
+
+def load_known_faces():
+    """Load gallery: worker đầu tiên build và publish, các worker sau chỉ map lại"""
+    if not face_gallery.load_or_build(build_known_faces, boot_id()):
+        print(f"[Load] Dùng gallery chung v{face_gallery.version}: {len(face_gallery)} khuôn mặt")
+
+def load_light_model():
+    """Nạp model pack nhẹ cho mức giảm tải thấp nhất, chỉ khi đã có gallery version của nó"""
+    global light_app, light_gallery
+    if not DEGRADE_MODEL or DEGRADE_MODEL == MODEL_NAME:
+        return
+    version = load_version(GALLERY_ROOT, DEGRADE_MODEL)
+    if version is None:
+        print(f"[Degrade] Chưa có gallery cho {DEGRADE_MODEL} (python reembed.py --model {DEGRADE_MODEL}), "
+              f"bỏ mức dùng model nhẹ")
+        return
+    light_app = create_face_app(model_name=DEGRADE_MODEL)
+    light_gallery = SharedGallery(STATE_DIR, prefix=f"smartdoor_gallery_{DEGRADE_MODEL}", dtype=GALLERY_DTYPE,
+                                  model_id=DEGRADE_MODEL)
+    light_gallery.load_or_build(lambda: (version["names"], version["embeddings"]), boot_id())
+    print(f"[Degrade] Model nhẹ {DEGRADE_MODEL}: {len(light_gallery)} khuôn mặt (gallery {version['created']})")
+
+def enroll_uid(uid: str):
+    """Embed ảnh đăng ký mới (do admin app upload) và đưa vào gallery chung"""
+    uid_directory.refresh(force=True)
+    path = uid_directory.path(uid)
+    if not path:
+        return
+    embedding = extract_embedding(path)
+    if embedding is not None:
+        face_gallery.upsert(uid, embedding, model_id=face_app.model_id)
+        print(f"[Enroll] ✓ Đã thêm: {uid}")
+
+def startup():
+    """Khởi tạo InsightFace và gallery cho worker"""
+    global face_app
+    print(f"[InsightFace] Đang khởi tạo model {MODEL_NAME} (profile: {PIPELINE_PROFILE})...")
+    face_app = create_face_app()
+    print(f"[InsightFace] Khởi tạo hoàn tất! Modules: {', '.join(face_app.models)}")
+    load_known_faces()
+    enrollments.start(enroll_uid)
+    if DEGRADE:
+        load_light_model()
+        # Không có model nhẹ thì bỏ các mức cần nó
+        degrader.max_level = max(i for i, level in enumerate(degrader.levels)
+                                 if not level["light_model"] or light_app is not None)
+    else:
+        degrader.max_level = 0
+
+# ============= Recognition API =============
+@router.post("/precheck")
+async def precheck_uid(request: Request):
+    """Kiểm tra UID có tồn tại ảnh không"""
+    cleanup_sessions()
+    try:
+        payload = await request.json()
+        uid = str(payload.get("uid", "")).strip()
+    except Exception:
+        return PlainTextResponse("no", status_code=400)
+    
+    if not uid:
+        return PlainTextResponse("no", status_code=400)
+    
+    if uid_directory.is_negative(uid):
+        metrics.PRECHECKS.labels("unknown_cached").inc()
+        return PlainTextResponse("no")
+    
+    # UID chưa có trong gallery phải tra face_data/ và có thể embed: giới hạn theo thiết bị để
+    # quẹt thẻ lạ dồn dập không thành tải. Thiết bị là X-Device-ID (cửa sau proxy/NAT), firmware
+    # chưa gửi header thì dùng IP. UID đã biết (kể cả khác hoa thường) trả lời từ bộ nhớ nên
+    # không bao giờ bị giới hạn.
+    device = request.headers.get("x-device-id") or (request.client.host if request.client else "unknown")
+    if gallery_uid(uid) not in face_gallery and not precheck_limiter.allow(device):
+        metrics.PRECHECKS.labels("rate_limited").inc()
+        return PlainTextResponse("no", status_code=429, headers={"Retry-After": "1"})
+    
+    enc = load_uid_encoding(uid)
+    if enc is None:
+        metrics.PRECHECKS.labels("no").inc()
+        return PlainTextResponse("no")
+    
+    # Tạo/refresh session
+    active_sessions.start(uid)
+    metrics.PRECHECKS.labels("yes").inc()
+    return PlainTextResponse("yes")
+
+@router.get("/result")
+async def get_result(uid: str = Query(...)):
+    """ESP32-DEV poll kết quả nhận diện"""
+    cleanup_sessions()
+    s = active_sessions.get(uid)
+    if not s:
+        return PlainTextResponse("no")
+    active_sessions.touch(uid)
+    return PlainTextResponse(s["status"])
+
+@router.post("/recognize")
+async def recognize_face(request: Request,
+                         x_uid: Optional[str] = Header(default=None),
+                         x_last_frame: Optional[str] = Header(default=None)):
+    """Nhận diện khuôn mặt từ frame ESP32-CAM"""
+    return await _handle_frame(request, frame_buffers, x_uid, x_last_frame)
+
+@router.post("/recognize/crop")
+async def recognize_crop(request: Request,
+                         x_uid: Optional[str] = Header(default=None),
+                         x_last_frame: Optional[str] = Header(default=None),
+                         x_landmarks: Optional[str] = Header(default=None),
+                         x_det_score: Optional[str] = Header(default=None)):
+    """Nhận diện từ ảnh mặt đã crop trên ESP32-CAM (camera tự detect khuôn mặt)
+
+    Body: JPEG vùng mặt. X-Landmarks (tùy chọn): 10 số "x,y" của mắt trái,
+    mắt phải, mũi, miệng trái, miệng phải theo toạ độ trong ảnh crop; không
+    có thì ước lượng theo bbox. X-Det-Score (tùy chọn): độ tin cậy của
+    detector trên camera. Server không chạy SCRFD, chỉ căn chỉnh + ArcFace;
+    session và log giống /recognize.
+    """
+    try:
+        kps = parse_landmarks(x_landmarks) if x_landmarks else None
+        det_score = float(x_det_score) if x_det_score else 1.0
+        if not 0.0 <= det_score <= 1.0:
+            raise ValueError(f"X-Det-Score ngoài [0, 1]: {x_det_score}")
+    except ValueError:
+        return PlainTextResponse("pending", status_code=400)
+    return await _handle_frame(request, crop_buffers, x_uid, x_last_frame, {"kps": kps, "det_score": det_score})
+
+def parse_landmarks(value: str):
+    """"x1,y1,...,x5,y5" -> mảng 5x2; ValueError nếu không đúng 10 số hữu hạn"""
+    kps = np.array([float(v) for v in value.replace(";", ",").split(",")], dtype=np.float32)
+    if kps.size != 10 or not np.isfinite(kps).all():
+        raise ValueError(f"X-Landmarks cần 10 số, nhận được {kps.size}")
+    return kps.reshape(5, 2)
+
+async def _handle_frame(request: Request, buffers: FrameBufferPool, x_uid: Optional[str],
+                        x_last_frame: Optional[str], crop: Optional[dict] = None):
+    """Đọc body, đo latency/hàng đợi (metrics, Server-Timing) rồi xử lý frame"""
+    global recognize_calls, recognize_queue
+    metrics.IN_FLIGHT.inc()
+    recognize_queue += 1
+    trace = metrics.start_trace()
+    t0 = time.perf_counter()
+    try:
+        try:
+            async with buffers.read(request) as image_bytes:
+                response = await _recognize_face(image_bytes, x_uid, x_last_frame, t0, crop)
+        except BodyTooLarge:
+            return PlainTextResponse("pending", status_code=413)
+        if trace is not None:
+            trace["total"] = (time.perf_counter() - t0) * 1000.0
+            response.headers["Server-Timing"] = metrics.server_timing(trace)
+        return response
+    finally:
+        elapsed = time.perf_counter() - t0
+        metrics.RECOGNIZE_SECONDS.observe(elapsed)
+        metrics.IN_FLIGHT.dec()
+        recognize_queue -= 1
+        recognize_calls += 1
+
+async def _recognize_face(image_bytes, x_uid: Optional[str], x_last_frame: Optional[str], started: float,
+                          crop: Optional[dict] = None):
+    cleanup_sessions()
+    
+    if not image_bytes:
+        return PlainTextResponse("pending", status_code=400)
+    
+    # Xác định UID cho phiên này
+    uid = None
+    if x_uid:
+        uid = x_uid.strip()
+    else:
+        uid = active_sessions.latest_uid()
+    
+    session = active_sessions.get(uid) if uid else None
+    if session is None:
+        return PlainTextResponse("pending", status_code=428)
+    
+    # Early-exit nếu đã kết thúc
+    if session["status"] in ("yess", "noo"):
+        active_sessions.touch(uid)
+        return PlainTextResponse(session["status"])
+    
+    frames = active_sessions.add_frame(uid)
+    is_last = (str(x_last_frame).strip() == "1")
+    
+    # Mức giảm tải hiện tại: khi quá tải chỉ xử lý 1/sample frame mỗi session (frame cuối luôn xử lý)
+    level = degrader.current()
+    if level["sample"] > 1 and not is_last and (frames - 1) % level["sample"]:
+        metrics.FRAMES_SAMPLED_OUT.inc()
+        return PlainTextResponse("pending")
+    
+    # Decode ảnh (frame đầy đủ: thu nhỏ ngay khi decode nếu lớn hơn nhiều so với det_size của mức hiện tại)
+    with stage("decode"):
+        if crop:
+            frame, scale = decode_full(image_bytes), 1
+        else:
+            frame, scale = decode_frame(image_bytes, level["det_size"])
+    if frame is None:
+        return PlainTextResponse("pending", status_code=400)
+    
+    # Lưu ảnh debug (ghi thẳng bytes JPEG gốc, không encode lại)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    raw_path = os.path.join(UPLOAD_FOLDER, f"{timestamp}_{'crop' if crop else 'raw'}.jpg")
+    with stage("save_raw"):
+        with open(raw_path, "wb") as f:
+            f.write(image_bytes)
+    upload_index.add(os.path.basename(raw_path))
+    
+    # Load embedding cần so sánh
+    enc_expected = load_uid_encoding(uid)
+    if enc_expected is None:
+        return finish_session(uid, "noo", frames)
+    
+    # Mức thấp nhất dùng model nhẹ nếu UID có trong gallery của nó
+    app, gallery = face_app, face_gallery
+    key = gallery_uid(uid)
+    if level["light_model"] and light_app is not None and key in light_gallery:
+        app, gallery = light_app, light_gallery
+    
+    # Detect faces, chọn khuôn mặt đủ chất lượng và chỉ embed chúng (tăng sáng vùng mặt khi frame thiếu sáng)
+    try:
+        if crop:
+            faces, detected = analyze_crop(app, frame, crop["kps"], crop["det_score"], stage=stage)
+        else:
+            faces, detected = analyze_frame(app, frame, det_size=level["det_size"], stage=stage, scale=scale,
+                                            full_frame=lambda: decode_full(image_bytes))
+    except Exception as e:
+        print(f"[Error] InsightFace detection error: {e}")
+        if is_last:
+            return finish_session(uid, "noo", frames)
+        return PlainTextResponse("pending")
+    finally:
+        # Chỉ request đã chạy decode -> detect -> embed mới phản ánh tải (413, 428, session đã chốt,
+        # frame bị bỏ qua gần như 0ms sẽ kéo p95 xuống). Hàng đợi không tính request này.
+        degrader.observe((time.perf_counter() - started) * 1000.0, recognize_queue - 1)
+    
+    # So sánh các khuôn mặt đã chọn (cosine similarity trên embedding đã chuẩn hóa);
+    # không mặt nào đủ chất lượng thì không chấm điểm, chờ frame sau
+    matched, best_similarity = False, 0.0
+    if faces:
+        with stage("score"):
+            matched, best_similarity = match_faces(faces, gallery, key, THRESHOLD, app.model_id)
+    
+    # Log
+    with stage("log"):
+        record = {
+            "timestamp": datetime.now().isoformat(),
+            "uid": uid,
+            "image_path": raw_path,
+            "face_count": detected,
+            "faces_used": len(faces),
+            "face_quality": round(faces[0].quality, 4) if faces else None,
+            "best_similarity": round(float(best_similarity), 4),
+            "threshold": THRESHOLD,
+            "matched": matched,
+            "model": app.model_id,
+            "degrade_level": degrader.level,
+            "edge_crop": crop is not None
+        }
+        timings = metrics.current_trace()
+        if timings is not None:
+            record["timings"] = timings
+        with open(os.path.join(LOG_FOLDER, "recognition_log.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    
+    # Trả kết quả
+    if matched:
+        return finish_session(uid, "yess", frames)
+    else:
+        if is_last:
+            return finish_session(uid, "noo", frames)
+        else:
+            # Chưa chốt: chỉ refresh ts, không ghi đè kết quả worker khác có thể đã chốt
+            active_sessions.touch(uid)
+            session = active_sessions.get(uid)
+            return PlainTextResponse(session["status"] if session else "pending")
+
+# ============= Metrics =============
+@router.get("/metrics")
+async def get_metrics():
+    """Metrics Prometheus: latency từng bước, hàng đợi, session, gallery, kết quả"""
+    cleanup_sessions()
+    metrics.ACTIVE_SESSIONS.set(len(active_sessions))
+    metrics.GALLERY_SIZE.set(len(face_gallery))
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+# ============= Profiling =============
+profiler = SamplingProfiler()
+recognize_calls = 0  # Số request /recognize đã xử lý (worker này)
+
+@router.post("/admin/profile", response_class=PlainTextResponse)
+async def admin_profile(x_admin_password: Optional[str] = Header(default=None),
+                        seconds: Optional[float] = Query(default=None, gt=0, le=PROFILE_MAX_SEC),
+                        calls: Optional[int] = Query(default=None, gt=0),
+                        interval_ms: float = Query(default=5.0, ge=1.0, le=100.0)):
+    """Bật sampling profiler trong `seconds` giây hoặc `calls` request /recognize tiếp theo
+
+    Trả về folded stacks (flamegraph.pl / speedscope). Chỉ profile worker nhận request này.
+    """
+    if not x_admin_password or not secrets.compare_digest(x_admin_password, ADMIN_PASSWORD):
+        raise HTTPException(status_code=403, detail="Sai mật khẩu")
+    if profiler.running:
+        raise HTTPException(status_code=409, detail="Profiler đang chạy")
+    if seconds is None and calls is None:
+        seconds = 10.0
+
+    profiler.interval_sec = interval_ms / 1000.0
+    profiler.start(threading.get_ident())  # Thread event loop, nơi /recognize chạy
+    start_calls = recognize_calls
+    deadline = time.monotonic() + (seconds or PROFILE_MAX_SEC)
+    try:
+        while time.monotonic() < deadline:
+            if calls is not None and recognize_calls - start_calls >= calls:
+                break
+            await asyncio.sleep(0.05)
+    finally:
+        folded = profiler.stop()
+    return PlainTextResponse(folded, headers={
+        "X-Profile-Samples": str(profiler.samples),
+        "X-Profile-Calls": str(recognize_calls - start_calls),
+    })
+
@@ -0,0 +1,104 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+# Khi chạy nhiều worker, main.py đặt PROMETHEUS_MULTIPROC_DIR trước khi spawn worker
+MULTIPROC = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+# Trace từng request (header Server-Timing + "timings" trong log), tắt bằng TRACE_REQUESTS=0
+TRACE_REQUESTS = os.getenv("TRACE_REQUESTS", "1") == "1"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+STAGE_SECONDS = Histogram(
+    "smartdoor_stage_seconds", "Thời gian từng bước của pipeline /recognize",
+    ["stage"], buckets=LATENCY_BUCKETS)
+RECOGNIZE_SECONDS = Histogram(
+    "smartdoor_recognize_seconds", "Tổng thời gian xử lý một frame /recognize",
+    buckets=LATENCY_BUCKETS)
+IN_FLIGHT = Gauge(
+    "smartdoor_recognize_in_flight", "Số request /recognize đang xử lý (hàng đợi)",
+    multiprocess_mode="livesum")
+ACTIVE_SESSIONS = Gauge(
+    "smartdoor_active_sessions", "Số session đang mở",
+    multiprocess_mode="livemostrecent")
+GALLERY_SIZE = Gauge(
+    "smartdoor_gallery_size", "Số khuôn mặt trong gallery",
+    multiprocess_mode="livemostrecent")
+FRAMES_PER_SESSION = Histogram(
+    "smartdoor_frames_per_session", "Số frame đã xử lý trước khi session có kết quả",
+    buckets=(1, 2, 3, 5, 8, 13, 20, 30, 50))
+DECISIONS = Counter(
+    "smartdoor_decisions_total", "Kết quả session", ["outcome"])  # yess / noo / timeout
+DEGRADE_LEVEL = Gauge(
+    "smartdoor_degrade_level", "Mức giảm tải hiện tại (0 = đầy đủ, xem degrade.py)",
+    multiprocess_mode="livemax")
+FRAMES_SAMPLED_OUT = Counter(
+    "smartdoor_frames_sampled_out_total", "Số frame bỏ qua do lấy mẫu khi giảm tải")
+PRECHECKS = Counter(
+    "smartdoor_precheck_total", "Kết quả /precheck", ["result"])  # yes / no / unknown_cached / rate_limited
+
+# Giữ sẵn child theo label để tránh tra cứu labels() mỗi lần đo
+_stage_children = {}
+# Thời gian (ms) từng bước của request hiện tại: {stage: ms}
+_trace: ContextVar[Optional[dict]] = ContextVar("smartdoor_trace", default=None)
+
+
+def stage_histogram(name: str):
+    child = _stage_children.get(name)
+    if child is None:
+        child = _stage_children[name] = STAGE_SECONDS.labels(name)
+    return child
+
+
+@contextmanager
+def stage(name: str):
+    """Đo thời gian một bước: with stage("decode"): ..."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        stage_histogram(name).observe(elapsed)
+        trace = _trace.get()
+        if trace is not None:
+            trace[name] = trace.get(name, 0.0) + elapsed * 1000.0
+
+
+def start_trace() -> Optional[dict]:
+    """Bắt đầu trace cho request hiện tại (None nếu tắt trace)"""
+    trace = {} if TRACE_REQUESTS else None
+    _trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[dict]:
+    """Timings (ms, làm tròn) của request hiện tại để ghi log"""
+    trace = _trace.get()
+    if trace is None:
+        return None
+    return {name: round(ms, 3) for name, ms in trace.items()}
+
+
+def server_timing(trace: dict) -> str:
+    """Giá trị header Server-Timing: decode;dur=1.2, detect;dur=35.0, ..."""
+    return ", ".join(f"{name};dur={ms:.2f}" for name, ms in trace.items())
+
+
+def record_decision(outcome: str, frames: int = 0):
+    DECISIONS.labels(outcome).inc()
+    if frames:
+        FRAMES_PER_SESSION.observe(frames)
+
+
+def render():
+    """Trả về (body, content_type) theo định dạng Prometheus text"""
+    if MULTIPROC:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,322 @@
+import os
+from contextlib import nullcontext
+from typing import Optional
+
+import cv2
+import numpy as np
+from insightface.app import FaceAnalysis
+from insightface.app.common import Face
+from insightface.utils import face_align
+
+from config import MODEL_NAME
+
+DET_SIZE = (640, 640)  # det_size càng lớn phát hiện mặt xa càng tốt
+PROVIDERS = ['CUDAExecutionProvider', 'CPUExecutionProvider']  # Tự động chọn GPU nếu có
+
+# Profile pipeline:
+#   "verify": chỉ detection + recognition (đủ cho so khớp embedding)
+#   "full":   toàn bộ model trong pack (thêm landmark 2D/3D, giới tính/tuổi)
+PIPELINE_PROFILES = {
+    "verify": ["detection", "recognition"],
+    "full": None,
+}
+PIPELINE_PROFILE = os.getenv("FACE_PIPELINE", "verify")
+
+
+def create_face_app(profile: str = PIPELINE_PROFILE, model_name: str = MODEL_NAME,
+                    det_size=DET_SIZE, providers=None) -> FaceAnalysis:
+    """Khởi tạo FaceAnalysis chỉ với các module mà profile cần"""
+    if profile not in PIPELINE_PROFILES:
+        raise ValueError(f"Profile không hợp lệ: {profile} (chọn: {', '.join(PIPELINE_PROFILES)})")
+
+    face_app = FaceAnalysis(
+        name=model_name,
+        allowed_modules=PIPELINE_PROFILES[profile],
+        providers=providers or PROVIDERS,
+    )
+    face_app.prepare(ctx_id=0, det_size=det_size)
+    face_app.model_id = model_name  # Không gian embedding, gallery chỉ so khớp cùng model_id
+    return face_app
+
+
+# ============= Decode =============
+# Hệ số thu nhỏ khi decode JPEG (libjpeg scale DCT trực tiếp, không decode full rồi resize)
+REDUCED_DECODE = ((4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+# Các marker SOF của JPEG (chứa kích thước ảnh), trừ DHT/JPG/DAC
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def jpeg_size(data) -> Optional[tuple]:
+    """Đọc (width, height) từ header JPEG mà không decode ảnh"""
+    n = len(data)
+    if n < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            i += 2
+            continue
+        if marker in _JPEG_SOF:
+            h = int.from_bytes(data[i + 5:i + 7], "big")
+            w = int.from_bytes(data[i + 7:i + 9], "big")
+            return w, h
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    return None
+
+
+def decode_scale(size: Optional[tuple], det_size=DET_SIZE) -> int:
+    """Chọn hệ số thu nhỏ lớn nhất mà cạnh dài vẫn >= cạnh dài của det_size"""
+    if not size:
+        return 1
+    long_side = max(size)
+    for factor, _ in REDUCED_DECODE:
+        if long_side // factor >= max(det_size):
+            return factor
+    return 1
+
+
+def decode_frame(image_bytes, det_size=DET_SIZE):
+    """Decode frame từ camera, dùng decode thu nhỏ khi frame lớn hơn nhiều so với det_size
+
+    Trả về (frame, factor): toạ độ trên frame nhân factor ra toạ độ ảnh gốc.
+    """
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    factor = decode_scale(jpeg_size(image_bytes), det_size)
+    flag = dict(REDUCED_DECODE).get(factor, cv2.IMREAD_COLOR)
+    return cv2.imdecode(nparr, flag), factor
+
+
+def decode_full(image_bytes):
+    """Decode giữ nguyên độ phân giải (ảnh mặt crop sẵn, hoặc căn chỉnh mặt nhỏ từ frame gốc)"""
+    return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+
+# ============= Tiền xử lý =============
+# Tăng sáng nhẹ convertScaleAbs(alpha=1.1, beta=5), tính sẵn thành LUT bằng chính convertScaleAbs
+# (tự làm tròn bằng numpy lệch 1 mức ở vài giá trị như 45, 85, ... do sai số float)
+BRIGHTEN_ALPHA = 1.1
+BRIGHTEN_BETA = 5
+BRIGHTEN_LUT = cv2.convertScaleAbs(np.arange(256, dtype=np.uint8)[None], alpha=BRIGHTEN_ALPHA,
+                                   beta=BRIGHTEN_BETA)[0]
+# Độ sáng trung bình (0-255) từ mức này trở lên coi là đủ sáng, bỏ qua tăng sáng
+WELL_EXPOSED_MEAN = float(os.getenv("WELL_EXPOSED_MEAN", "110"))
+
+
+def is_well_exposed(frame) -> bool:
+    """Ước lượng độ sáng trên ảnh lấy mẫu thưa (1/64 số pixel)"""
+    return float(frame[::8, ::8].mean()) >= WELL_EXPOSED_MEAN
+
+
+def aligned_face(frame, kps, image_size: int, brighten: bool):
+    """Căn chỉnh khuôn mặt theo 5 landmark; chỉ tăng sáng vùng ảnh mà phép warp dùng tới"""
+    if not brighten:
+        return face_align.norm_crop(frame, landmark=kps, image_size=image_size)
+
+    M = face_align.estimate_norm(kps, image_size)
+    corners = np.array([[0, 0, 1], [image_size, 0, 1], [0, image_size, 1], [image_size, image_size, 1]],
+                       dtype=np.float64)
+    src = corners @ cv2.invertAffineTransform(M).T
+    h, w = frame.shape[:2]
+    x0, y0 = np.clip(np.floor(src.min(axis=0)).astype(int) - 1, 0, None)
+    x1 = min(int(np.ceil(src[:, 0].max())) + 2, w)
+    y1 = min(int(np.ceil(src[:, 1].max())) + 2, h)
+    if x1 <= x0 or y1 <= y0:
+        return face_align.norm_crop(frame, landmark=kps, image_size=image_size)
+
+    crop = cv2.LUT(frame[y0:y1, x0:x1], BRIGHTEN_LUT)
+    return face_align.norm_crop(crop, landmark=kps - np.array([x0, y0], dtype=kps.dtype),
+                                image_size=image_size)
+
+
+def detect_faces(face_app: FaceAnalysis, frame, det_size=None):
+    """Chỉ chạy detection (SCRFD), trả về danh sách Face chưa có embedding"""
+    bboxes, kpss = face_app.det_model.detect(frame, input_size=det_size, max_num=0, metric='default')
+    faces = []
+    for i in range(bboxes.shape[0]):
+        faces.append(Face(bbox=bboxes[i, 0:4], kps=kpss[i] if kpss is not None else None,
+                          det_score=bboxes[i, 4]))
+    return faces
+
+
+def embed_face(face_app: FaceAnalysis, frame, face: Face, brighten: bool, scale: float = 1):
+    """Chạy ArcFace cho một khuôn mặt đã detect (scale: toạ độ face.kps nhân scale ra toạ độ trên frame)"""
+    rec_model = face_app.models["recognition"]
+    kps = face.kps * scale if scale != 1 else face.kps
+    aimg = aligned_face(frame, kps, rec_model.input_size[0], brighten)
+    face.embedding = rec_model.get_feat(aimg).flatten()
+    return face.embedding
+
+
+# ============= Chọn khuôn mặt =============
+# Ngưỡng chất lượng trước khi chạy ArcFace (đặt 0 để tắt từng tiêu chí)
+MIN_DET_SCORE = float(os.getenv("FACE_MIN_DET_SCORE", "0.6"))
+MIN_FACE_PX = float(os.getenv("FACE_MIN_SIZE", "40"))  # Cạnh ngắn bbox (pixel trên ảnh gốc từ camera)
+MAX_POSE = float(os.getenv("FACE_MAX_POSE", "0.45"))  # Độ nghiêng ước lượng từ 5 landmark (0 = nhìn thẳng)
+MIN_SHARPNESS = float(os.getenv("FACE_MIN_SHARPNESS", "40"))  # Phương sai Laplacian vùng mặt (64x64)
+MAX_EMBED_FACES = int(os.getenv("FACE_MAX_EMBED", "1"))  # Số khuôn mặt tốt nhất được embed mỗi frame
+GOOD_FACE_PX = 112  # Từ cỡ này trở lên (bằng input ArcFace) không cộng thêm điểm kích thước
+SHARPNESS_SIZE = 64
+
+
+def face_pose(kps) -> float:
+    """Độ lệch góc mặt từ 5 landmark: max(yaw, pitch), 0 khi nhìn thẳng
+
+    yaw: mũi lệch khỏi trung điểm hai mắt (chia khoảng cách hai mắt)
+    pitch: vị trí mũi giữa mắt và miệng lệch khỏi tỉ lệ ~0.5 của mặt nhìn thẳng
+    """
+    left_eye, right_eye, nose, mouth_left, mouth_right = kps
+    eye_mid = (left_eye + right_eye) / 2
+    mouth_mid = (mouth_left + mouth_right) / 2
+    eye_dist = max(float(np.linalg.norm(right_eye - left_eye)), 1e-6)
+    yaw = abs(float(nose[0] - eye_mid[0])) / eye_dist
+    face_height = max(float(mouth_mid[1] - eye_mid[1]), 1e-6)
+    pitch = abs(float(nose[1] - eye_mid[1]) / face_height - 0.5)
+    return max(yaw, pitch)
+
+
+def face_sharpness(frame, bbox) -> float:
+    """Phương sai Laplacian trên vùng mặt (xám, thu về 64x64 để không phụ thuộc cỡ mặt)"""
+    h, w = frame.shape[:2]
+    x0, y0 = max(int(bbox[0]), 0), max(int(bbox[1]), 0)
+    x1, y1 = min(int(bbox[2]), w), min(int(bbox[3]), h)
+    if x1 - x0 < 2 or y1 - y0 < 2:
+        return 0.0
+    gray = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+    gray = cv2.resize(gray, (SHARPNESS_SIZE, SHARPNESS_SIZE), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+
+def select_faces(frame, faces, top_k: int = MAX_EMBED_FACES, scale: int = 1):
+    """Xếp hạng khuôn mặt theo det_score, kích thước và góc mặt, loại mặt dưới ngưỡng hoặc bị mờ
+
+    Trả về tối đa top_k khuôn mặt tốt nhất (điểm trong face.quality). Độ nét
+    chỉ tính cho các ứng viên theo thứ hạng, dừng khi đã đủ top_k.
+    scale: hệ số decode thu nhỏ của frame; kích thước mặt được so theo pixel
+    ảnh gốc (mặt nhỏ được căn chỉnh lại từ ảnh gốc, xem analyze_frame).
+    """
+    candidates = []
+    for face in faces:
+        if face.det_score < MIN_DET_SCORE or face.kps is None:
+            continue
+        side = float(min(face.bbox[2] - face.bbox[0], face.bbox[3] - face.bbox[1])) * scale
+        if side < MIN_FACE_PX:
+            continue
+        pose = face_pose(face.kps)
+        if MAX_POSE and pose > MAX_POSE:
+            continue
+        face.quality = float(face.det_score) * min(1.0, side / GOOD_FACE_PX) * (1.0 - min(pose, 1.0))
+        candidates.append(face)
+    candidates.sort(key=lambda f: f.quality, reverse=True)
+
+    selected = []
+    for face in candidates:
+        if len(selected) >= top_k:
+            break
+        if MIN_SHARPNESS and face_sharpness(frame, face.bbox) < MIN_SHARPNESS:
+            continue
+        selected.append(face)
+    return selected
+
+
+# ============= Ảnh mặt crop sẵn (edge) =============
+# Vị trí 5 landmark (mắt trái, mắt phải, mũi, miệng trái, miệng phải) theo tỉ lệ bbox,
+# dùng khi camera gửi ảnh crop theo bbox mà không kèm landmark
+CROP_KPS_TEMPLATE = np.array([[0.34, 0.46], [0.66, 0.46], [0.50, 0.64], [0.37, 0.82], [0.63, 0.82]],
+                             dtype=np.float32)
+
+
+def crop_face(crop, kps=None, det_score: float = 1.0) -> Face:
+    """Face cho cả ảnh crop; kps (5x2, toạ độ trong ảnh crop) ước lượng theo template nếu không có"""
+    h, w = crop.shape[:2]
+    if kps is None:
+        kps = CROP_KPS_TEMPLATE * np.array([w, h], dtype=np.float32)
+    return Face(bbox=np.array([0, 0, w, h], dtype=np.float32), kps=np.asarray(kps, np.float32),
+                det_score=det_score)
+
+
+def _no_stage(name):
+    return nullcontext()
+
+
+def analyze_frame(face_app: FaceAnalysis, frame, det_size=None, stage=_no_stage, top_k: int = MAX_EMBED_FACES,
+                  scale: int = 1, full_frame=None):
+    """Detect, chọn khuôn mặt đủ chất lượng rồi embed (thay cho convertScaleAbs + face_app.get)
+
+    Trả về (khuôn mặt đã embed, số khuôn mặt detect được); danh sách rỗng
+    khi không có mặt nào qua ngưỡng chất lượng.
+    stage: context manager đo thời gian từng bước (xem metrics.stage)
+    scale, full_frame: frame được decode thu nhỏ scale lần; mặt nhỏ hơn input
+    ArcFace trên frame thu nhỏ được căn chỉnh từ full_frame() (decode đầy đủ,
+    chỉ gọi khi cần) để không mất chi tiết so với frame gốc.
+    """
+    with stage("detect"):
+        faces = detect_faces(face_app, frame, det_size)
+    if not faces:
+        return faces, 0
+    detected = len(faces)
+    with stage("quality"):
+        faces = select_faces(frame, faces, top_k, scale)
+    if not faces:
+        return faces, detected
+    with stage("embed"):
+        brighten = not is_well_exposed(frame)
+        rec_size = face_app.models["recognition"].input_size[0]
+        full = None
+        for face in faces:
+            side = min(face.bbox[2] - face.bbox[0], face.bbox[3] - face.bbox[1])
+            if scale > 1 and full_frame is not None and side < rec_size:
+                if full is None:
+                    full = full_frame()
+                if full is not None:
+                    embed_face(face_app, full, face, brighten, scale)
+                    continue
+            embed_face(face_app, frame, face, brighten)
+    for taskname, model in face_app.models.items():
+        if taskname not in ("detection", "recognition"):
+            with stage(taskname):
+                for face in faces:
+                    model.get(frame, face)
+    return faces, detected
+
+
+def analyze_crop(face_app: FaceAnalysis, crop, kps=None, det_score: float = 1.0, stage=_no_stage):
+    """Như analyze_frame cho ảnh mặt đã crop trên camera: bỏ qua SCRFD, căn chỉnh theo kps và chỉ chạy ArcFace
+
+    Vẫn qua cùng ngưỡng chất lượng (kích thước, góc mặt, độ nét); trả về (khuôn mặt đã embed, 1).
+    """
+    with stage("quality"):
+        faces = select_faces(crop, [crop_face(crop, kps, det_score)], top_k=1)
+    if faces:
+        with stage("embed"):
+            embed_face(face_app, crop, faces[0], brighten=not is_well_exposed(crop))
+    return faces, 1
+
+
+def enrollment_embedding(face_app: FaceAnalysis, img):
+    """Embedding (đã chuẩn hóa L2) của khuôn mặt đầu tiên trong ảnh đăng ký, None nếu không có mặt"""
+    faces = face_app.get(img)
+    if len(faces) == 0:
+        return None
+    # Lấy khuôn mặt đầu tiên (giả sử mỗi ảnh có 1 người)
+    embedding = faces[0].embedding
+    return embedding / np.linalg.norm(embedding)
+
+
+# ============= So khớp =============
+def match_faces(faces, gallery, uid: str, threshold: float, model_id: Optional[str] = None):
+    """So khớp mọi khuôn mặt trong frame với embedding của UID, trả về (matched, best_similarity)"""
+    if not faces:
+        return False, 0.0
+    embeddings = np.stack([face.embedding for face in faces]).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    similarities = gallery.similarity(uid, embeddings, model_id=model_id)
+    if similarities is None:
+        return False, 0.0
+    best_similarity = max(float(similarities.max()), 0.0)
+    return best_similarity >= threshold, best_similarity
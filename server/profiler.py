@@ -0,0 +1,54 @@
+import sys
+import threading
+from collections import Counter
+
+
+class SamplingProfiler:
+    """Profiler lấy mẫu stack của một thread theo chu kỳ, không cần restart server.
+
+    Kết quả ở dạng "folded stacks" (mỗi dòng: frame;frame;frame count), mở được
+    bằng flamegraph.pl, speedscope hoặc inferno.
+    """
+
+    def __init__(self, interval_sec: float = 0.005):
+        self.interval_sec = interval_sec
+        self.stacks = Counter()
+        self.samples = 0
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, thread_id: int):
+        self.stacks.clear()
+        self.samples = 0
+        self._thread_id = thread_id
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> str:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.folded()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_sec):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
@@ -0,0 +1,28 @@
+import time
+from collections import OrderedDict
+
+
+class RateLimiter:
+    """Token bucket theo thiết bị: trung bình rate request/giây, tối đa burst request liên tiếp.
+
+    Giữ tối đa max_keys thiết bị, thiết bị lâu không gửi bị bỏ trước.
+    Mỗi worker có bucket riêng (giới hạn thực tế = rate x số worker).
+    """
+
+    def __init__(self, rate: float, burst: int, max_keys: int = 4096):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, thời điểm cập nhật)
+
+    def allow(self, key: str) -> bool:
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        allowed = tokens >= 1.0
+        if allowed:
+            tokens -= 1.0
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed
@@ -0,0 +1,71 @@
+"""Embed lại toàn bộ face_data/ cho một model, tạo gallery version mới.
+
+Dùng khi đổi model (vd buffalo_l -> buffalo_s hoặc model lượng tử hóa):
+chuẩn bị trước gallery cho model mới, rồi đổi FACE_MODEL và restart server
+mà không phải embed lại lúc khởi động.
+
+    python reembed.py --model buffalo_s --workers 4
+    python reembed.py --model buffalo_l --incremental   # chỉ embed ảnh mới/đã sửa
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from config import FACE_FOLDER, GALLERY_ROOT, MODEL_NAME
+from gallery_versions import load_version, reconcile, save_version, scan_sources, version_path
+
+_face_app = None
+
+
+def _init_worker(model_name: str):
+    global _face_app
+    from pipeline import create_face_app
+    _face_app = create_face_app(profile="verify", model_name=model_name)
+
+
+def _embed(path: str):
+    from pipeline import enrollment_embedding
+    img = cv2.imread(path)
+    if img is None:
+        return path, None
+    return path, enrollment_embedding(_face_app, img)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    # Mặc định trùng cấu hình server (config.py) để server nạp đúng version vừa tạo
+    parser.add_argument("--model", default=MODEL_NAME, help="Model pack InsightFace")
+    parser.add_argument("--faces", default=FACE_FOLDER)
+    parser.add_argument("--out", default=GALLERY_ROOT, help="Thư mục gallery versions")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--incremental", action="store_true",
+                        help="Giữ embedding của ảnh không đổi từ version hiện có")
+    args = parser.parse_args()
+
+    sources = scan_sources(args.faces)
+    version = load_version(args.out, args.model) if args.incremental else None
+    todo = [uid for uid, src in sources.items() if not version or version["sources"].get(uid) != src]
+    print(f"[Reembed] {args.model}: {len(sources)} ảnh, cần embed {len(todo)} (workers={args.workers})")
+
+    t0 = time.perf_counter()
+    results = {}
+    if todo:
+        paths = [os.path.join(args.faces, sources[uid][0]) for uid in todo]
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                 initargs=(args.model,)) as pool:
+            for path, embedding in pool.map(_embed, paths, chunksize=8):
+                results[os.path.basename(path)] = embedding
+                if embedding is None:
+                    print(f"  ⚠ Không phát hiện khuôn mặt: {os.path.basename(path)}")
+
+    names, embeddings, _ = reconcile(version, sources, results.get)
+    save_version(args.out, args.model, names, embeddings, sources)
+    print(f"[Reembed] Xong {len(names)} khuôn mặt trong {time.perf_counter() - t0:.1f}s "
+          f"-> {version_path(args.out, args.model)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+
+
+class SessionStore:
+    """Session nhận diện theo UID, lưu trong SQLite (WAL) để mọi worker cùng thấy.
+
+    Mỗi session: {"status": "pending"/"yess"/"noo", "ts": epoch_seconds, "frames": số frame đã xử lý}.
+    """
+
+    def __init__(self, path: str, ttl_sec: int):
+        self.path = path
+        self.ttl_sec = ttl_sec
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " uid TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " ts INTEGER NOT NULL,"
+            " frames INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+        if "frames" not in columns:
+            conn.execute("ALTER TABLE sessions ADD COLUMN frames INTEGER NOT NULL DEFAULT 0")
+
+    def _conn(self) -> sqlite3.Connection:
+        # Mỗi thread một connection (endpoint async chạy trên event loop, sync chạy trong threadpool)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, uid: str) -> Optional[dict]:
+        row = self._conn().execute("SELECT status, ts, frames FROM sessions WHERE uid = ?", (uid,)).fetchone()
+        if row is None:
+            return None
+        return {"status": row[0], "ts": row[1], "frames": row[2]}
+
+    def start(self, uid: str):
+        """Mở session mới (pending, đếm frame từ 0)"""
+        self._conn().execute(
+            "INSERT OR REPLACE INTO sessions (uid, status, ts, frames) VALUES (?, 'pending', ?, 0)",
+            (uid, int(time.time())),
+        )
+
+    def finish(self, uid: str, status: str) -> Tuple[Optional[str], bool]:
+        """Chốt session pending sang status (yess/noo), trả về (status đang lưu, worker này có chốt không)
+
+        Chỉ session còn pending mới được chốt: frame chậm ở worker khác không
+        ghi đè kết quả đã chốt. Thua thì trả về kết quả đã lưu (None nếu
+        session đã hết hạn).
+        """
+        conn = self._conn()
+        row = conn.execute(
+            "UPDATE sessions SET status = ?, ts = ? WHERE uid = ? AND status = 'pending' RETURNING status",
+            (status, int(time.time()), uid),
+        ).fetchone()
+        if row:
+            return row[0], True
+        session = self.get(uid)
+        return (session["status"] if session else None), False
+
+    def add_frame(self, uid: str) -> int:
+        """Tăng số frame của session, trả về số frame hiện tại"""
+        row = self._conn().execute(
+            "UPDATE sessions SET frames = frames + 1, ts = ? WHERE uid = ? RETURNING frames",
+            (int(time.time()), uid),
+        ).fetchone()
+        return row[0] if row else 0
+
+    def touch(self, uid: str):
+        self._conn().execute("UPDATE sessions SET ts = ? WHERE uid = ?", (int(time.time()), uid))
+
+    def latest_uid(self) -> Optional[str]:
+        row = self._conn().execute("SELECT uid FROM sessions ORDER BY ts DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def cleanup(self):
+        """Xóa các session hết hạn, trả về số frame của những session hết hạn khi còn pending"""
+        rows = self._conn().execute(
+            "DELETE FROM sessions WHERE ts < ? RETURNING status, frames",
+            (int(time.time()) - self.ttl_sec,),
+        ).fetchall()
+        return [frames for status, frames in rows if status == "pending"]
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
@@ -0,0 +1,31 @@
+"""Trạng thái dùng chung giữa inference app và admin app.
+
+Chỉ gồm những thứ không cần model: gallery embedding trên shared memory,
+index UID -> ảnh trong face_data/, index ảnh uploads/ và hàng đợi đăng ký. Thay đổi từ admin app (xóa UID,
+ảnh mới) tới inference app qua các store này.
+"""
+import os
+
+from config import (FACE_FOLDER, GALLERY_DTYPE, LOG_FOLDER, MODEL_NAME, STATE_DIR, UNKNOWN_UID_TTL_SEC,
+                    UPLOAD_FOLDER)
+from enrollment import EnrollmentQueue
+from gallery_store import SharedGallery
+from uid_directory import UidDirectory
+from upload_index import UploadIndex
+
+os.makedirs(FACE_FOLDER, exist_ok=True)
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(LOG_FOLDER, exist_ok=True)
+os.makedirs(STATE_DIR, exist_ok=True)
+
+# Gallery embedding (shared memory), dùng chung giữa các worker và giữa hai app
+face_gallery = SharedGallery(STATE_DIR, dtype=GALLERY_DTYPE, model_id=MODEL_NAME)  # { uid: embedding_vector }
+
+# UID -> ảnh đăng ký (không phân biệt hoa thường), nơi duy nhất tra face_data/ theo UID
+uid_directory = UidDirectory(FACE_FOLDER, negative_ttl=UNKNOWN_UID_TTL_SEC)
+
+# Index ảnh debug trong uploads/ (inference ghi frame, admin hiển thị /gallery)
+upload_index = UploadIndex(UPLOAD_FOLDER)
+
+# UID vừa upload ảnh qua admin app, chờ inference app embed
+enrollments = EnrollmentQueue(os.path.join(STATE_DIR, "enroll"))
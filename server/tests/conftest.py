@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Các module server import nhau theo tên phẳng (chạy từ server/), nên đưa server/ vào sys.path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
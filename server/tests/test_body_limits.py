@@ -0,0 +1,113 @@
+import os
+
+import pytest
+from fastapi import FastAPI, File, Request, UploadFile
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+
+from body_limits import BodyLimitMiddleware, BodyTooLarge, FrameBufferPool, save_upload_image
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 1000
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 1000
+
+
+def chunks(data: bytes, size: int = 256):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+@pytest.fixture
+def upload_client(tmp_path):
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        kind = await save_upload_image(file, str(tmp_path / file.filename), max_bytes=2048)
+        return PlainTextResponse(kind)
+
+    return TestClient(app)
+
+
+def test_upload_saved_atomically(upload_client, tmp_path):
+    r = upload_client.post("/upload", files={"file": ("AA41D95.jpg", JPEG, "image/jpeg")})
+    assert r.status_code == 200 and r.text == "jpeg"
+    assert (tmp_path / "AA41D95.jpg").read_bytes() == JPEG
+    assert os.listdir(tmp_path) == ["AA41D95.jpg"]
+
+
+def test_upload_magic_bytes_must_match_extension(upload_client, tmp_path):
+    r = upload_client.post("/upload", files={"file": ("AA41D95.jpg", PNG, "application/octet-stream")})
+    assert r.status_code == 400
+    r = upload_client.post("/upload", files={"file": ("AA41D95.png", JPEG, "image/jpeg")})
+    assert r.status_code == 400
+    assert os.listdir(tmp_path) == []
+
+
+def test_upload_too_large_keeps_previous_file(upload_client, tmp_path):
+    (tmp_path / "AA41D95.jpg").write_bytes(JPEG)
+    r = upload_client.post("/upload", files={"file": ("AA41D95.jpg", JPEG * 3, "image/jpeg")})
+    assert r.status_code == 413
+    # Ảnh cũ còn nguyên, không sót file .tmp
+    assert (tmp_path / "AA41D95.jpg").read_bytes() == JPEG
+    assert os.listdir(tmp_path) == ["AA41D95.jpg"]
+
+
+@pytest.fixture
+def limited_client():
+    app = FastAPI()
+    seen = []
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        seen.append(file.filename)
+        return PlainTextResponse("ok")
+
+    app.add_middleware(BodyLimitMiddleware, max_bytes=4096, paths=("/upload",))
+    client = TestClient(app)
+    client.seen = seen
+    return client
+
+
+def test_body_limit_rejects_declared_length(limited_client):
+    r = limited_client.post("/upload", files={"file": ("a.jpg", JPEG * 5, "image/jpeg")})
+    assert r.status_code == 413 and limited_client.seen == []
+    r = limited_client.post("/upload", files={"file": ("a.jpg", JPEG, "image/jpeg")})
+    assert r.status_code == 200 and limited_client.seen == ["a.jpg"]
+
+
+def test_body_limit_counts_chunked_body(limited_client):
+    body = b"--x\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.jpg\"\r\n\r\n" + JPEG * 5
+    r = limited_client.post("/upload", content=chunks(body),
+                            headers={"Content-Type": "multipart/form-data; boundary=x"})
+    assert r.status_code == 413 and limited_client.seen == []
+
+
+@pytest.fixture
+def frame_client():
+    app = FastAPI()
+    pool = FrameBufferPool(max_bytes=1024, size=2)
+
+    @app.post("/frame")
+    async def frame(request: Request):
+        try:
+            async with pool.read(request) as body:
+                return PlainTextResponse(str(bytes(body[:4]).hex()) + f":{len(body)}")
+        except BodyTooLarge:
+            return PlainTextResponse("too large", status_code=413)
+
+    return TestClient(app)
+
+
+def test_frame_pool_with_content_length(frame_client):
+    r = frame_client.post("/frame", content=JPEG)
+    assert r.status_code == 200 and r.text == "ffd8ffe0:1004"
+    assert frame_client.post("/frame", content=JPEG * 2).status_code == 413
+
+
+def test_frame_pool_without_content_length(frame_client):
+    r = frame_client.post("/frame", content=chunks(JPEG))
+    assert r.status_code == 200 and r.text == "ffd8ffe0:1004"
+    assert frame_client.post("/frame", content=chunks(JPEG * 2)).status_code == 413
+    # Bộ đệm dùng lại không giữ dữ liệu cũ ngoài phần vừa đọc
+    r = frame_client.post("/frame", content=chunks(PNG[:8]))
+    assert r.text == "89504e47:8"
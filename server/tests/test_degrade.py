@@ -0,0 +1,137 @@
+import secrets
+import time
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import inference_app
+from degrade import DEGRADE_LEVELS, DegradationController
+from session_store import SessionStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+
+def controller(**kwargs):
+    return DegradationController(slo_ms=300, max_queue=4, **{"min_samples": 5, "cooldown_sec": 5.0, **kwargs})
+
+
+def feed(degrader, latency_ms, count, queue_depth=0):
+    for _ in range(count):
+        degrader.observe(latency_ms, queue_depth)
+
+
+def test_steps_down_on_slo_breach(clock):
+    degrader = controller()
+    feed(degrader, 500, 4)
+    assert degrader.level == 0  # Chưa đủ min_samples
+    feed(degrader, 500, 1)
+    assert degrader.level == 1 and degrader.current() == DEGRADE_LEVELS[1]
+
+
+def test_steps_down_on_queue_depth(clock):
+    degrader = controller()
+    feed(degrader, 50, 5, queue_depth=5)
+    assert degrader.level == 1
+
+
+def test_waits_cooldown_and_min_samples_after_change(clock):
+    degrader = controller()
+    feed(degrader, 500, 5)
+    assert degrader.level == 1
+    # Trong cooldown: vẫn quá SLO nhưng giữ mức
+    feed(degrader, 500, 20)
+    assert degrader.level == 1
+    clock[0] += 6
+    feed(degrader, 500, 1)
+    assert degrader.level == 2
+    # Hết cooldown nhưng mẫu ở mức mới chưa đủ min_samples
+    clock[0] += 6
+    feed(degrader, 500, 4)
+    assert degrader.level == 2
+    feed(degrader, 500, 1)
+    assert degrader.level == 3
+
+
+def test_steps_up_below_recover_ratio(clock):
+    degrader = controller(window=5)
+    feed(degrader, 500, 5)
+    clock[0] += 6
+    # Dưới SLO nhưng trên recover_ratio x SLO: giữ mức
+    feed(degrader, 200, 5)
+    assert degrader.level == 1
+    # Còn hàng đợi: chưa tăng lại
+    feed(degrader, 100, 5, queue_depth=2)
+    assert degrader.level == 1
+    feed(degrader, 100, 1)
+    assert degrader.level == 0
+
+
+def test_max_level_without_light_model(clock):
+    degrader = controller()
+    # Như startup() khi không nạp được model nhẹ
+    degrader.max_level = max(i for i, level in enumerate(DEGRADE_LEVELS) if not level["light_model"])
+    for _ in range(10):
+        feed(degrader, 5000, 5)
+        clock[0] += 6
+    assert degrader.level == degrader.max_level == 3
+    assert not degrader.current()["light_model"]
+
+
+class RecordingController(DegradationController):
+    def __init__(self):
+        super().__init__(slo_ms=300, max_queue=4)
+        self.observed = []
+
+    def observe(self, latency_ms, queue_depth):
+        self.observed.append((latency_ms, queue_depth))
+
+
+@pytest.fixture
+def recognize_client(tmp_path, monkeypatch):
+    degrader = RecordingController()
+    monkeypatch.setattr(inference_app, "degrader", degrader)
+    monkeypatch.setattr(inference_app, "active_sessions", SessionStore(str(tmp_path / "sessions.db"), ttl_sec=45))
+    # Detect -> embed không tìm thấy mặt nào
+    monkeypatch.setattr(inference_app, "face_app", SimpleNamespace(model_id="buffalo_l"))
+    monkeypatch.setattr(inference_app, "analyze_frame", lambda *args, **kwargs: ([], 0))
+    monkeypatch.setattr(inference_app, "load_uid_encoding", lambda uid: np.ones(512, np.float32))
+    monkeypatch.setattr(inference_app, "UPLOAD_FOLDER", str(tmp_path))
+    monkeypatch.setattr(inference_app, "LOG_FOLDER", str(tmp_path))
+    app = FastAPI()
+    app.include_router(inference_app.router)
+    client = TestClient(app)
+    client.degrader = degrader
+    return client
+
+
+def test_only_analyzed_frames_feed_controller(recognize_client):
+    frame = cv2.imencode(".jpg", np.zeros((240, 320, 3), np.uint8))[1].tobytes()
+    uid = f"UID{secrets.token_hex(3)}"
+    headers = {"X-UID": uid, "Content-Type": "image/jpeg"}
+    # Chưa precheck: 428
+    assert recognize_client.post("/recognize", content=frame, headers=headers).status_code == 428
+    assert recognize_client.degrader.observed == []
+
+    inference_app.active_sessions.start(uid)
+    # Giảm tải sample=2: frame 1 được xử lý và đo, frame 2 bị bỏ qua thì không
+    recognize_client.degrader.level = 3
+    assert recognize_client.post("/recognize", content=frame, headers=headers).text == "pending"
+    assert len(recognize_client.degrader.observed) == 1
+    assert recognize_client.post("/recognize", content=frame, headers=headers).text == "pending"
+    assert len(recognize_client.degrader.observed) == 1
+
+    # Session đã chốt: trả ngay, không đo
+    recognize_client.post("/recognize", content=frame, headers={**headers, "X-Last-Frame": "1"})
+    assert len(recognize_client.degrader.observed) == 2
+    assert recognize_client.post("/recognize", content=frame, headers=headers).text == "noo"
+    assert len(recognize_client.degrader.observed) == 2
+    assert all(queue == 0 for _, queue in recognize_client.degrader.observed)
@@ -0,0 +1,94 @@
+import secrets
+
+import numpy as np
+import pytest
+
+from gallery_store import SharedGallery, dequantize, quantize, score_block
+
+# Sai số similarity cho phép so với float32 (xem bench/gallery_precision.py)
+TOLERANCE = {"float16": 1e-3, "int8": 1e-2}
+
+
+def units(count: int, seed: int = 0, dim: int = 512):
+    v = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def make_gallery(tmp_path):
+    created = []
+
+    def make(dtype):
+        gallery = SharedGallery(str(tmp_path), prefix=f"smartdoor_test_{secrets.token_hex(4)}", dtype=dtype,
+                                model_id="buffalo_l")
+        created.append(gallery)
+        return gallery
+
+    yield make
+    for gallery in created:
+        gallery.unlink()
+
+
+def test_int8_scales_per_row():
+    embeddings = units(4)
+    data, scales = quantize(embeddings, "int8")
+    assert data.dtype == np.int8 and scales.dtype == np.float32 and scales.shape == (4,)
+    np.testing.assert_allclose(scales, np.abs(embeddings).max(axis=1) / 127.0, rtol=1e-6)
+    assert np.abs(data).max(axis=1).tolist() == [127] * 4
+    np.testing.assert_allclose(dequantize(data, scales), embeddings, atol=scales.max() / 2 + 1e-6)
+
+
+def test_int8_zero_row_stays_zero():
+    embeddings = np.zeros((2, 512), np.float32)
+    embeddings[1] = units(1)[0]
+    data, scales = quantize(embeddings, "int8")
+    assert scales[0] == 1.0 and not data[0].any()
+    assert np.isfinite(dequantize(data, scales)).all()
+
+
+def test_float_dtypes_have_no_scales():
+    data, scales = quantize(units(2), "float16")
+    assert data.dtype == np.float16 and scales is None
+    data, scales = quantize(units(2), "float32")
+    assert data.dtype == np.float32 and scales is None
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_score_block_matches_float32(dtype):
+    gallery, queries = units(300, seed=1), units(5, seed=2)
+    data, scales = quantize(gallery, dtype)
+    expected = gallery @ queries.T
+    np.testing.assert_allclose(score_block(data, scales, queries), expected, atol=TOLERANCE[dtype])
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_similarity_and_search_agree_with_float32(make_gallery, dtype):
+    embeddings = units(50, seed=3)
+    reference, compact = make_gallery("float32"), make_gallery(dtype)
+    for i, embedding in enumerate(embeddings):
+        reference.upsert(f"UID{i:02d}", embedding)
+        compact.upsert(f"UID{i:02d}", embedding)
+    probes = embeddings[:10] * 0.8 + units(10, seed=4) * 0.6
+    probes /= np.linalg.norm(probes, axis=1, keepdims=True)
+
+    np.testing.assert_allclose(compact.similarity("UID03", probes), reference.similarity("UID03", probes),
+                               atol=TOLERANCE[dtype])
+    for probe in probes:
+        (uid, sim), = compact.search(probe)
+        (ref_uid, ref_sim), = reference.search(probe)
+        assert uid == ref_uid and sim == pytest.approx(ref_sim, abs=TOLERANCE[dtype])
+
+
+def test_int8_upsert_remove_keep_scales_aligned(make_gallery):
+    gallery = make_gallery("int8")
+    embeddings = units(4, seed=5)
+    # Các dòng có biên độ khác nhau để scale mỗi dòng khác nhau
+    for i, embedding in enumerate(embeddings):
+        gallery.upsert(f"UID{i}", embedding * (i + 1))
+    gallery.upsert("UID1", embeddings[1] * 10)
+    assert gallery.remove("UID0")
+    assert gallery.names == ["UID1", "UID2", "UID3"]
+    assert gallery.data.shape[0] == gallery.scales.shape[0] == 3
+    for uid, expected in (("UID1", embeddings[1] * 10), ("UID2", embeddings[2] * 3), ("UID3", embeddings[3] * 4)):
+        np.testing.assert_allclose(gallery.get(uid), expected, atol=np.abs(expected).max() / 127)
+    assert gallery.search(embeddings[2])[0][0] == "UID2"
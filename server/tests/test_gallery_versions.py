@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+
+from gallery_versions import load_version, reconcile, save_version, scan_sources
+
+
+def unit(seed: int, dim: int = 512):
+    v = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+class Embedder:
+    """embed(tên file) giả lập: ghi lại file được embed, None cho ảnh không có mặt"""
+
+    def __init__(self, faceless=(), seed: int = 0):
+        self.calls = []
+        self.faceless = set(faceless)
+        self.seed = seed
+
+    def __call__(self, filename):
+        self.calls.append(filename)
+        return None if filename in self.faceless else unit(self.seed * 1000 + len(self.calls))
+
+
+def write_faces(folder, *names):
+    for name in names:
+        (folder / name).write_bytes(name.encode())
+
+
+def test_reconcile_first_build_embeds_everything(tmp_path):
+    write_faces(tmp_path, "AA41D95.jpg", "BA272895.png", "NOFACE.jpg", "notes.txt")
+    sources = scan_sources(str(tmp_path))
+    assert sorted(sources) == ["AA41D95", "BA272895", "NOFACE"]
+    embed = Embedder(faceless={"NOFACE.jpg"})
+    names, embeddings, changed = reconcile(None, sources, embed)
+    assert changed and sorted(embed.calls) == ["AA41D95.jpg", "BA272895.png", "NOFACE.jpg"]
+    assert names == ["AA41D95", "BA272895"] and len(embeddings) == 2
+
+
+def test_reconcile_reuses_unchanged_sources(tmp_path):
+    write_faces(tmp_path, "AA41D95.jpg", "BA272895.png", "NOFACE.jpg")
+    out = tmp_path / "galleries"
+    sources = scan_sources(str(tmp_path))
+    names, embeddings, _ = reconcile(None, sources, Embedder(faceless={"NOFACE.jpg"}))
+    save_version(str(out), "buffalo_l", names, embeddings, sources)
+    version = load_version(str(out), "buffalo_l")
+    assert load_version(str(out), "buffalo_s") is None
+
+    # Không đổi gì: không embed lại, kể cả ảnh không có mặt, và changed=False
+    embed = Embedder()
+    names2, embeddings2, changed = reconcile(version, scan_sources(str(tmp_path)), embed)
+    assert embed.calls == [] and not changed
+    assert names2 == names
+    np.testing.assert_allclose(np.stack(embeddings2), np.stack(embeddings))
+
+    # Sửa một ảnh, xóa một ảnh: chỉ embed ảnh đã sửa
+    (tmp_path / "AA41D95.jpg").write_bytes(b"new image bytes")
+    os.remove(tmp_path / "BA272895.png")
+    embed = Embedder(seed=1)
+    names3, embeddings3, changed = reconcile(version, scan_sources(str(tmp_path)), embed)
+    assert changed and embed.calls == ["AA41D95.jpg"]
+    assert names3 == ["AA41D95"]
+    assert not np.allclose(embeddings3[0], embeddings[0])
@@ -0,0 +1,46 @@
+import cv2
+import numpy as np
+from insightface.app.common import Face
+
+import pipeline
+
+
+def face_at(x: float, y: float, side: float, det_score: float = 0.9) -> Face:
+    kps = np.array([[0.34, 0.46], [0.66, 0.46], [0.50, 0.64], [0.37, 0.82], [0.63, 0.82]], np.float32)
+    return Face(bbox=np.array([x, y, x + side, y + side], np.float32), kps=kps * side + [x, y],
+                det_score=det_score)
+
+
+def test_brighten_lut_matches_convert_scale_abs():
+    values = np.arange(256, dtype=np.uint8)[None]
+    expected = cv2.convertScaleAbs(values, alpha=pipeline.BRIGHTEN_ALPHA, beta=pipeline.BRIGHTEN_BETA)
+    np.testing.assert_array_equal(pipeline.BRIGHTEN_LUT[values], expected)
+
+
+def test_jpeg_size_reads_header():
+    img = np.zeros((120, 200, 3), np.uint8)
+    data = cv2.imencode(".jpg", img)[1].tobytes()
+    assert pipeline.jpeg_size(data) == (200, 120)
+    assert pipeline.jpeg_size(memoryview(data)) == (200, 120)
+
+
+def test_jpeg_size_rejects_non_jpeg():
+    png = cv2.imencode(".png", np.zeros((8, 8, 3), np.uint8))[1].tobytes()
+    assert pipeline.jpeg_size(png) is None
+    assert pipeline.jpeg_size(b"\xff\xd8") is None
+
+
+def test_select_faces_measures_size_in_source_pixels(monkeypatch):
+    monkeypatch.setattr(pipeline, "MIN_SHARPNESS", 0)
+    frame = np.zeros((300, 400, 3), np.uint8)
+    # 120px trên ảnh gốc 1600px, decode 1/4 còn 30px
+    small = face_at(100, 100, 30)
+    assert pipeline.select_faces(frame, [small], scale=1) == []
+    assert pipeline.select_faces(frame, [small], scale=4) == [small]
+
+
+def test_decode_frame_reports_reduction_factor():
+    data = cv2.imencode(".jpg", np.zeros((1200, 1600, 3), np.uint8))[1].tobytes()
+    frame, factor = pipeline.decode_frame(data, (320, 320))
+    assert factor == 4 and frame.shape[:2] == (300, 400)
+    assert pipeline.decode_full(data).shape[:2] == (1200, 1600)
@@ -0,0 +1,102 @@
+import os
+import secrets
+import time
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import inference_app
+from gallery_store import SharedGallery
+from rate_limit import RateLimiter
+from session_store import SessionStore
+from uid_directory import UidDirectory
+
+
+def test_rate_limiter_burst_then_refill(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    limiter = RateLimiter(rate=2, burst=3)
+    assert [limiter.allow("door-1") for _ in range(4)] == [True, True, True, False]
+    assert limiter.allow("door-2")
+    now[0] += 0.5
+    assert limiter.allow("door-1")
+    assert not limiter.allow("door-1")
+
+
+def test_rate_limiter_evicts_oldest_key():
+    limiter = RateLimiter(rate=1, burst=1, max_keys=2)
+    for key in ("a", "b", "c"):
+        limiter.allow(key)
+    assert list(limiter._buckets) == ["b", "c"]
+
+
+def test_uid_directory_index_and_rescan(tmp_path):
+    (tmp_path / "AA41D95.jpg").write_bytes(b"x")
+    (tmp_path / "notes.txt").write_bytes(b"x")
+    directory = UidDirectory(str(tmp_path), rescan_sec=0)
+    assert len(directory) == 1
+    assert directory.path("AA41D95") == str(tmp_path / "AA41D95.jpg")
+    assert directory.path("notes") is None
+    (tmp_path / "BA272895.png").write_bytes(b"x")
+    os.utime(tmp_path, ns=(0, time.time_ns() + 10**9))
+    assert directory.path("BA272895") == str(tmp_path / "BA272895.png")
+
+
+def test_uid_directory_negative_cache(tmp_path, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    directory = UidDirectory(str(tmp_path), rescan_sec=1000, negative_ttl=30)
+    directory.mark_negative("UNKNOWN")
+    assert directory.is_negative("UNKNOWN")
+    now[0] += 31
+    assert not directory.is_negative("UNKNOWN")
+
+
+def test_uid_directory_is_case_insensitive(tmp_path):
+    (tmp_path / "AA41D95.jpg").write_bytes(b"x")
+    (tmp_path / "ba272895.PNG").write_bytes(b"x")
+    directory = UidDirectory(str(tmp_path), rescan_sec=0)
+    assert directory.path("aa41d95") == str(tmp_path / "AA41D95.jpg")
+    assert directory.name("aa41d95") == "AA41D95"
+    assert directory.name("BA272895") == "ba272895"
+    assert directory.items() == [("AA41D95", "AA41D95.jpg"), ("ba272895", "ba272895.PNG")]
+    directory.mark_negative("unknown1")
+    assert directory.is_negative("UNKNOWN1")
+
+
+@pytest.fixture
+def precheck_client(tmp_path, monkeypatch):
+    faces = tmp_path / "face_data"
+    faces.mkdir()
+    (faces / "AA41D95.jpg").write_bytes(b"x")
+    gallery = SharedGallery(str(tmp_path), prefix=f"smartdoor_test_{secrets.token_hex(4)}", model_id="buffalo_l")
+    gallery.upsert("AA41D95", np.ones(512, np.float32) / np.sqrt(512))
+    monkeypatch.setattr(inference_app, "face_gallery", gallery)
+    monkeypatch.setattr(inference_app, "uid_directory", UidDirectory(str(faces), rescan_sec=1000))
+    monkeypatch.setattr(inference_app, "active_sessions", SessionStore(str(tmp_path / "sessions.db"), ttl_sec=45))
+    # Mỗi thiết bị chỉ một lượt tra UID lạ
+    monkeypatch.setattr(inference_app, "precheck_limiter", RateLimiter(rate=0.001, burst=1))
+    app = FastAPI()
+    app.include_router(inference_app.router)
+    yield TestClient(app)
+    gallery.unlink()
+
+
+def test_precheck_limits_unknown_uids_by_client_ip(precheck_client):
+    # Firmware hiện tại không gửi X-Device-ID: giới hạn theo IP
+    assert precheck_client.post("/precheck", json={"uid": "UNKNOWN1"}).text == "no"
+    r = precheck_client.post("/precheck", json={"uid": "UNKNOWN2"})
+    assert r.status_code == 429 and r.headers["retry-after"] == "1"
+    # Cửa khác (X-Device-ID riêng) không bị ảnh hưởng
+    r = precheck_client.post("/precheck", json={"uid": "UNKNOWN3"}, headers={"X-Device-ID": "door-2"})
+    assert r.status_code == 200
+
+
+def test_precheck_never_limits_known_card(precheck_client):
+    precheck_client.post("/precheck", json={"uid": "UNKNOWN1"})
+    # Hết token nhưng thẻ đã đăng ký, kể cả quẹt với UID khác hoa thường, vẫn được trả lời
+    for uid in ("AA41D95", "aa41d95", "Aa41d95"):
+        r = precheck_client.post("/precheck", json={"uid": uid})
+        assert r.status_code == 200 and r.text == "yes"
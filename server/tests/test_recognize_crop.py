@@ -0,0 +1,141 @@
+import secrets
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import inference_app
+import pipeline
+from gallery_store import SharedGallery
+from session_store import SessionStore
+
+EMBEDDING = np.ones(512, np.float32) / np.sqrt(512)
+LANDMARKS = "54,74,106,74,80,102,59,131,101,131"
+
+
+class StubFaceApp:
+    """Chỉ có ArcFace: detector assert nếu bị gọi (ảnh crop không được chạy SCRFD)"""
+    model_id = "buffalo_l"
+
+    def __init__(self):
+        self.det_model = SimpleNamespace(detect=self._detect)
+        self.embedded = []
+        recognition = SimpleNamespace(input_size=(112, 112), get_feat=self._get_feat)
+        self.models = {"detection": self.det_model, "recognition": recognition}
+
+    def _detect(self, *args, **kwargs):
+        raise AssertionError("SCRFD không được chạy cho ảnh crop")
+
+    def _get_feat(self, aimg):
+        assert aimg.shape == (112, 112, 3)
+        self.embedded.append(aimg)
+        return EMBEDDING[None]
+
+
+def sharp_crop(w: int = 160, h: int = 160, seed: int = 0):
+    return np.random.default_rng(seed).integers(0, 256, (h, w, 3), dtype=np.uint8)
+
+
+# ----- parse_landmarks / analyze_crop -----
+def test_parse_landmarks():
+    kps = inference_app.parse_landmarks(LANDMARKS)
+    assert kps.shape == (5, 2) and kps[0].tolist() == [54, 74]
+    np.testing.assert_array_equal(inference_app.parse_landmarks(LANDMARKS.replace(",", ";")), kps)
+    for value in ("1,2,3", "a,b,c,d,e,f,g,h,i,j", "nan,74,106,74,80,102,59,131,101,131", ""):
+        with pytest.raises(ValueError):
+            inference_app.parse_landmarks(value)
+
+
+def test_analyze_crop_uses_template_without_landmarks():
+    app, crop = StubFaceApp(), sharp_crop(160, 200)
+    faces, detected = pipeline.analyze_crop(app, crop)
+    assert detected == 1 and len(faces) == 1 and len(app.embedded) == 1
+    np.testing.assert_allclose(faces[0].kps, pipeline.CROP_KPS_TEMPLATE * [160, 200])
+    np.testing.assert_array_equal(faces[0].bbox, [0, 0, 160, 200])
+    np.testing.assert_array_equal(faces[0].embedding, EMBEDDING)
+
+
+def test_analyze_crop_uses_given_landmarks():
+    kps = inference_app.parse_landmarks(LANDMARKS)
+    faces, _ = pipeline.analyze_crop(StubFaceApp(), sharp_crop(), kps, det_score=0.9)
+    np.testing.assert_array_equal(faces[0].kps, kps)
+    assert faces[0].det_score == 0.9
+
+
+def test_analyze_crop_applies_quality_gate():
+    app = StubFaceApp()
+    # Quá nhỏ, det_score thấp, quay nghiêng, mờ: không chạy ArcFace
+    assert pipeline.analyze_crop(app, sharp_crop(24, 24)) == ([], 1)
+    assert pipeline.analyze_crop(app, sharp_crop(), det_score=0.1) == ([], 1)
+    profile = np.array([[60, 80], [100, 80], [105, 120], [70, 160], [110, 160]], np.float32)
+    assert pipeline.analyze_crop(app, sharp_crop(), profile) == ([], 1)
+    assert pipeline.analyze_crop(app, np.full((160, 160, 3), 128, np.uint8)) == ([], 1)
+    assert app.embedded == []
+
+
+# ----- /recognize/crop -----
+@pytest.fixture
+def crop_client(tmp_path, monkeypatch):
+    gallery = SharedGallery(str(tmp_path), prefix=f"smartdoor_test_{secrets.token_hex(4)}", model_id="buffalo_l")
+    gallery.upsert("AA41D95", EMBEDDING)
+    app = StubFaceApp()
+    calls = []
+
+    def analyze_crop(*args, **kwargs):
+        calls.append(kwargs.get("kps", args[2] if len(args) > 2 else None))
+        return pipeline.analyze_crop(*args, **kwargs)
+
+    monkeypatch.setattr(inference_app, "face_app", app)
+    monkeypatch.setattr(inference_app, "face_gallery", gallery)
+    monkeypatch.setattr(inference_app, "analyze_crop", analyze_crop)
+    monkeypatch.setattr(inference_app, "active_sessions", SessionStore(str(tmp_path / "sessions.db"), ttl_sec=45))
+    monkeypatch.setattr(inference_app, "UPLOAD_FOLDER", str(tmp_path))
+    monkeypatch.setattr(inference_app, "LOG_FOLDER", str(tmp_path))
+    server = FastAPI()
+    server.include_router(inference_app.router)
+    client = TestClient(server)
+    client.face_app, client.calls = app, calls
+    yield client
+    gallery.unlink()
+
+
+def post_crop(client, body, **headers):
+    return client.post("/recognize/crop", content=body,
+                       headers={"X-UID": "AA41D95", "Content-Type": "image/jpeg", **headers})
+
+
+@pytest.mark.parametrize("headers", [
+    {"X-Landmarks": "1,2,3"},
+    {"X-Landmarks": "54,74,106,74,80,102,59,131,101,inf"},
+    {"X-Det-Score": "high"},
+    {"X-Det-Score": "1.5"},
+])
+def test_crop_rejects_malformed_headers(crop_client, headers):
+    inference_app.active_sessions.start("AA41D95")
+    r = post_crop(crop_client, cv2.imencode(".jpg", sharp_crop())[1].tobytes(), **headers)
+    assert r.status_code == 400 and r.text == "pending"
+    assert crop_client.calls == [] and inference_app.active_sessions.get("AA41D95")["frames"] == 0
+
+
+def test_crop_matches_without_scrfd(crop_client):
+    body = cv2.imencode(".png", sharp_crop())[1].tobytes()
+    # PNG không nén mất mát: ảnh crop vẫn đủ nét sau khi decode
+    inference_app.active_sessions.start("AA41D95")
+    r = post_crop(crop_client, body)
+    assert r.status_code == 200 and r.text == "yess"
+    assert crop_client.calls == [None] and len(crop_client.face_app.embedded) == 1
+
+    inference_app.active_sessions.start("AA41D95")
+    r = post_crop(crop_client, body, **{"X-Landmarks": LANDMARKS, "X-Det-Score": "0.9"})
+    assert r.text == "yess"
+    np.testing.assert_array_equal(crop_client.calls[1], inference_app.parse_landmarks(LANDMARKS))
+
+
+def test_crop_quality_gate_keeps_session_pending(crop_client):
+    inference_app.active_sessions.start("AA41D95")
+    r = post_crop(crop_client, cv2.imencode(".png", sharp_crop(24, 24))[1].tobytes())
+    assert r.status_code == 200 and r.text == "pending"
+    assert crop_client.face_app.embedded == []
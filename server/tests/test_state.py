@@ -0,0 +1,129 @@
+import secrets
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+from gallery_store import SharedGallery
+from session_store import SessionStore
+
+
+def unit(seed: int, dim: int = 512):
+    v = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+# ----- SessionStore -----
+def test_session_lifecycle(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.db"), ttl_sec=45)
+    assert store.get("AA41D95") is None
+    store.start("AA41D95")
+    assert store.get("AA41D95")["status"] == "pending"
+    assert store.add_frame("AA41D95") == 1
+    assert store.add_frame("AA41D95") == 2
+    assert store.add_frame("UNKNOWN") == 0
+    assert store.finish("AA41D95", "yess") == ("yess", True)
+    session = store.get("AA41D95")
+    assert session["status"] == "yess" and session["frames"] == 2
+    assert store.latest_uid() == "AA41D95"
+    assert len(store) == 1
+
+
+def test_session_cleanup_reports_pending_frames(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.db"), ttl_sec=45)
+    store.start("PENDING")
+    store.add_frame("PENDING")
+    store.start("DONE")
+    store.finish("DONE", "noo")
+    store._conn().execute("UPDATE sessions SET ts = ts - 100")
+    store.start("FRESH")
+    assert store.cleanup() == [1]
+    assert store.get("PENDING") is None and store.get("DONE") is None
+    assert store.get("FRESH") is not None
+
+
+def test_session_finish_only_from_pending(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    worker_a, worker_b = SessionStore(path, ttl_sec=45), SessionStore(path, ttl_sec=45)
+    worker_a.start("AA41D95")
+    assert worker_a.finish("AA41D95", "yess") == ("yess", True)
+    # Frame chậm ở worker khác không được ghi đè kết quả đã chốt
+    assert worker_b.finish("AA41D95", "noo") == ("yess", False)
+    assert worker_b.get("AA41D95")["status"] == "yess"
+    assert worker_b.finish("EXPIRED", "noo") == (None, False)
+
+
+# ----- SharedGallery -----
+@pytest.fixture
+def gallery_pair(tmp_path):
+    prefix = f"smartdoor_test_{secrets.token_hex(4)}"
+    writer = SharedGallery(str(tmp_path), prefix=prefix, model_id="buffalo_l")
+    reader = SharedGallery(str(tmp_path), prefix=prefix, model_id="buffalo_l")
+    yield writer, reader
+    writer.unlink()
+
+
+def test_gallery_upsert_visible_to_other_worker(gallery_pair):
+    writer, reader = gallery_pair
+    writer.upsert("AA41D95", unit(1))
+    writer.upsert("BA272895", unit(2))
+    assert "AA41D95" in reader and len(reader) == 2
+    np.testing.assert_allclose(reader.get("AA41D95"), unit(1), atol=1e-6)
+    assert reader.version == writer.version
+
+
+def test_gallery_upsert_replaces_and_remove(gallery_pair):
+    writer, reader = gallery_pair
+    writer.upsert("AA41D95", unit(1))
+    writer.upsert("AA41D95", unit(3))
+    assert len(reader) == 1
+    np.testing.assert_allclose(reader.get("AA41D95"), unit(3), atol=1e-6)
+    assert writer.remove("AA41D95") is True
+    assert writer.remove("AA41D95") is False
+    assert "AA41D95" not in reader and len(reader) == 0
+
+
+def test_gallery_ignores_other_model(gallery_pair, tmp_path):
+    writer, _ = gallery_pair
+    writer.upsert("AA41D95", unit(1))
+    other = SharedGallery(str(tmp_path), prefix=writer.prefix, model_id="buffalo_s")
+    assert len(other) == 0
+
+
+def test_gallery_reads_consistent_while_enrolling(gallery_pair):
+    writer, _ = gallery_pair
+    # AA41D95 nằm sau các UID bị xóa/thêm lại nên chỉ số dòng của nó dịch liên tục
+    for i in range(300):
+        writer.upsert(f"UID{i}", unit(10 + i))
+    writer.upsert("AA41D95", unit(1))
+    done = threading.Event()
+    errors = []
+
+    def enroll():
+        # Thread nền upsert/remove liên tục trên cùng object mà request đang đọc
+        try:
+            for i in range(300):
+                writer.remove(f"UID{i}")
+                writer.upsert(f"UID{i}", unit(10 + i))
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            done.set()
+
+    probe = unit(1)[None]
+    # Chuyển thread thật dày để lộ khoảng hở giữa các bước map lại
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    thread = threading.Thread(target=enroll)
+    thread.start()
+    try:
+        while not done.is_set():
+            # Dòng của AA41D95 không bao giờ bị lẫn với dòng khác
+            assert writer.similarity("AA41D95", probe)[0] == pytest.approx(1.0, abs=1e-5)
+            assert writer.search(unit(1))[0][0] == "AA41D95"
+            np.testing.assert_allclose(writer.get("AA41D95"), unit(1), atol=1e-6)
+    finally:
+        thread.join()
+        sys.setswitchinterval(interval)
+    assert errors == []
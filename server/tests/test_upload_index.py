@@ -0,0 +1,12 @@
+from upload_index import UploadIndex
+
+
+def test_upload_index_idle_until_first_page(tmp_path):
+    index = UploadIndex(str(tmp_path))
+    index.add("20260101_000000_000001_raw.jpg")
+    assert index._names == []
+    (tmp_path / "20260101_000000_000001_raw.jpg").write_bytes(b"x")
+    assert index.page(1, 10) == (1, ["20260101_000000_000001_raw.jpg"])
+    index.add("20260101_000000_000002_raw.jpg")
+    index.add("20260101_000000_000002_raw.thumb.jpg")
+    assert index._names == ["20260101_000000_000001_raw.jpg", "20260101_000000_000002_raw.jpg"]
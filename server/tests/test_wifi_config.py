@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import wifi_config
+from wifi_config import WifiConfigStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = WifiConfigStore(str(tmp_path / "wifi.json"), check_sec=0.05)
+    monkeypatch.setattr(wifi_config, "wifi_config", store)
+    return store
+
+
+@pytest.fixture
+def client(store):
+    app = FastAPI()
+    wifi_config.install(app)
+    return TestClient(app)
+
+
+def test_save_bumps_version_and_etag(store):
+    etag = store.etag
+    assert store.version == 0 and store.config == {"ssid": "", "password": ""}
+    store.save("SmartDoor", "12345678")
+    assert store.version == 1 and store.etag != etag
+    assert store.config == {"ssid": "SmartDoor", "password": "12345678"}
+    # Worker khác mở cùng file thấy cùng version và ETag
+    assert WifiConfigStore(store.path).etag == store.etag
+
+
+def test_if_none_match_returns_304(client, store):
+    r = client.get("/wifi_config")
+    assert r.status_code == 200 and r.json()["version"] == 0
+    etag = r.headers["etag"]
+    assert client.get("/wifi_config", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/wifi_config", headers={"If-None-Match": f"W/{etag}"}).status_code == 304
+    assert client.get("/wifi_config", headers={"If-None-Match": f'"0-stale", {etag}'}).status_code == 304
+    store.save("SmartDoor", "12345678")
+    r = client.get("/wifi_config", headers={"If-None-Match": etag})
+    assert r.status_code == 200 and r.json()["ssid"] == "SmartDoor"
+
+
+def test_long_poll_wakes_on_other_writer(client, store):
+    etag = store.etag
+    # Admin worker là một store khác trên cùng file
+    admin = WifiConfigStore(store.path)
+    timer = threading.Timer(0.2, admin.save, ("SmartDoor", "12345678"))
+    timer.start()
+    start = time.monotonic()
+    r = client.get("/wifi_config", params={"wait": 10}, headers={"If-None-Match": etag})
+    timer.join()
+    assert r.status_code == 200 and r.json() == {"ssid": "SmartDoor", "password": "12345678", "version": 1}
+    assert r.headers["etag"] == admin.etag
+    assert time.monotonic() - start < 5
+
+
+def test_long_poll_times_out_with_304(client, store):
+    start = time.monotonic()
+    r = client.get("/wifi_config", params={"wait": 0.3}, headers={"If-None-Match": store.etag})
+    assert r.status_code == 304 and r.headers["etag"] == store.etag
+    assert time.monotonic() - start >= 0.3
+
+
+def test_refresh_throttles_stat(tmp_path, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    store = WifiConfigStore(str(tmp_path / "wifi.json"), check_sec=1.0)
+    store.refresh()
+    WifiConfigStore(store.path).save("SmartDoor", "12345678")
+    # Chưa tới check_sec: vẫn giữ bản trong bộ nhớ
+    now[0] += 0.5
+    store.refresh()
+    assert store.version == 0
+    now[0] += 0.6
+    store.refresh()
+    assert store.version == 1 and store.config["ssid"] == "SmartDoor"
@@ -0,0 +1,87 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from config import IMAGE_EXTS
+
+
+class UidDirectory:
+    """Tra UID -> ảnh đăng ký trong face_data/ bằng index trong bộ nhớ.
+
+    UID không phân biệt hoa thường (thẻ có thể gửi "aa41d95" cho ảnh
+    AA41D95.jpg); name() trả về UID theo tên file, dùng làm khóa gallery.
+    Index được quét lại khi mtime thư mục đổi, kiểm tra tối đa mỗi
+    rescan_sec giây, nên quẹt thẻ lạ không gây listdir. UID không có ảnh
+    (hoặc ảnh không có mặt) được nhớ trong negative cache negative_ttl giây,
+    tối đa max_negative mục; thư mục đổi thì xóa toàn bộ negative cache.
+    """
+
+    def __init__(self, folder: str, rescan_sec: float = 1.0, negative_ttl: float = 30.0,
+                 max_negative: int = 10000):
+        self.folder = folder
+        self.rescan_sec = rescan_sec
+        self.negative_ttl = negative_ttl
+        self.max_negative = max_negative
+        self._files = {}  # uid.lower() -> tên file
+        self._items = []  # [(uid, tên file)] sắp xếp theo UID
+        self._negative = OrderedDict()  # uid -> thời điểm hết hạn
+        self._dir_mtime = None
+        self._checked = 0.0
+
+    def refresh(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._checked < self.rescan_sec:
+            return
+        self._checked = now
+        mtime = os.stat(self.folder).st_mtime_ns
+        if mtime == self._dir_mtime:
+            return
+        files = {}
+        for fn in sorted(os.listdir(self.folder)):
+            if fn.lower().endswith(IMAGE_EXTS):
+                files.setdefault(os.path.splitext(fn)[0].lower(), fn)
+        self._files = files
+        self._items = sorted((os.path.splitext(fn)[0], fn) for fn in files.values())
+        self._dir_mtime = mtime
+        self._negative.clear()
+
+    def __len__(self):
+        self.refresh()
+        return len(self._files)
+
+    def items(self) -> list:
+        """[(uid, tên file)] của mọi UID đã đăng ký, sắp xếp theo UID"""
+        self.refresh()
+        return self._items
+
+    def path(self, uid: str) -> Optional[str]:
+        """Đường dẫn ảnh của UID, None nếu chưa đăng ký"""
+        self.refresh()
+        fn = self._files.get(uid.lower())
+        return os.path.join(self.folder, fn) if fn else None
+
+    def name(self, uid: str) -> Optional[str]:
+        """UID theo tên file ảnh (khóa trong gallery), None nếu chưa đăng ký"""
+        self.refresh()
+        fn = self._files.get(uid.lower())
+        return os.path.splitext(fn)[0] if fn else None
+
+    def is_negative(self, uid: str) -> bool:
+        self.refresh()
+        key = uid.lower()
+        expires = self._negative.get(key)
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            self._negative.pop(key, None)
+            return False
+        return True
+
+    def mark_negative(self, uid: str):
+        # pop + gán (không move_to_end): an toàn khi thread khác vừa xóa cache lúc quét lại
+        key = uid.lower()
+        self._negative.pop(key, None)
+        self._negative[key] = time.monotonic() + self.negative_ttl
+        while len(self._negative) > self.max_negative:
+            self._negative.popitem(last=False)
@@ -0,0 +1,134 @@
+import bisect
+import os
+import queue
+import threading
+import time
+
+from config import IMAGE_EXTS
+
+THUMB_SUFFIX = ".thumb.jpg"  # Thumbnail nằm cạnh ảnh gốc: <tên>.thumb.jpg
+THUMB_WIDTH = 200
+
+
+def thumb_name(name: str) -> str:
+    return os.path.splitext(name)[0] + THUMB_SUFFIX
+
+
+def is_frame(name: str) -> bool:
+    lower = name.lower()
+    return lower.endswith(IMAGE_EXTS) and not lower.endswith(THUMB_SUFFIX)
+
+
+class UploadIndex:
+    """Danh sách ảnh trong uploads/ giữ trong bộ nhớ, sắp xếp theo tên (timestamp).
+
+    Frame do worker này ghi được thêm ngay qua add(). Frame do worker khác
+    ghi được thấy khi mtime thư mục đổi, kiểm tra tối đa mỗi rescan_sec giây.
+    Index chỉ được giữ sau lần page() đầu tiên: process không phục vụ /gallery
+    (APP_ROLE=inference) không bao giờ đọc nên add() không làm gì.
+    """
+
+    def __init__(self, folder: str, rescan_sec: float = 5.0):
+        self.folder = folder
+        self.rescan_sec = rescan_sec
+        self._names = []  # tăng dần theo tên
+        self._dir_mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _rescan(self):
+        mtime = os.stat(self.folder).st_mtime_ns
+        if mtime == self._dir_mtime:
+            return
+        with os.scandir(self.folder) as it:
+            names = sorted(e.name for e in it if is_frame(e.name))
+        self._names = names
+        self._dir_mtime = mtime
+
+    def refresh(self, force: bool = False):
+        now = time.monotonic()
+        with self._lock:
+            if force or self._dir_mtime is None or now - self._checked_at >= self.rescan_sec:
+                self._checked_at = now
+                self._rescan()
+
+    def add(self, name: str):
+        """Thêm frame vừa ghi mà không cần quét lại thư mục"""
+        if not is_frame(name):
+            return
+        with self._lock:
+            if self._dir_mtime is None:
+                return
+            i = bisect.bisect_left(self._names, name)
+            if i == len(self._names) or self._names[i] != name:
+                self._names.insert(i, name)
+
+    def page(self, page: int, per_page: int):
+        """Trả về (tổng số ảnh, danh sách tên của trang), mới nhất trước"""
+        self.refresh()
+        with self._lock:
+            total = len(self._names)
+            end = total - (page - 1) * per_page
+            start = max(end - per_page, 0)
+            items = self._names[start:end][::-1] if end > 0 else []
+        return total, items
+
+
+class ThumbnailWorker:
+    """Thread nền tạo thumbnail theo yêu cầu, mỗi ảnh chỉ xếp hàng một lần"""
+
+    def __init__(self, folder: str, width: int = THUMB_WIDTH):
+        self.folder = folder
+        self.width = width
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def thumb_path(self, name: str) -> str:
+        return os.path.join(self.folder, thumb_name(name))
+
+    def request(self, name: str):
+        """Xếp hàng tạo thumbnail nếu chưa có"""
+        if os.path.exists(self.thumb_path(name)):
+            return
+        with self._lock:
+            if name in self._pending:
+                return
+            self._pending.add(name)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="thumbnails", daemon=True)
+                self._thread.start()
+        self._queue.put(name)
+
+    def _run(self):
+        while True:
+            name = self._queue.get()
+            try:
+                self._make(name)
+            except Exception as e:
+                print(f"[Thumb] Lỗi tạo thumbnail {name}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(name)
+
+    def _make(self, name: str):
+        import cv2  # Import muộn: admin app không phải nạp OpenCV nếu không cần tạo thumbnail
+
+        dst = self.thumb_path(name)
+        if os.path.exists(dst):
+            return
+        # Decode thu nhỏ 1/2 rồi resize về chiều rộng thumbnail
+        img = cv2.imread(os.path.join(self.folder, name), cv2.IMREAD_REDUCED_COLOR_2)
+        if img is None:
+            return
+        h, w = img.shape[:2]
+        if w > self.width:
+            img = cv2.resize(img, (self.width, max(1, h * self.width // w)), interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        if not ok:
+            return
+        tmp = f"{dst}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(buf.tobytes())
+        os.replace(tmp, dst)
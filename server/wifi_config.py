@@ -0,0 +1,129 @@
+"""WiFi config cho ESP32: store trong bộ nhớ và endpoint /wifi_config.
+
+Endpoint thuộc phía thiết bị (gắn vào inference app); trang sửa
+/wifi_panel nằm ở admin app và ghi qua cùng store.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+from fastapi import APIRouter, FastAPI, Query, Request
+from fastapi.responses import Response
+
+from config import WIFI_CONFIG_FILE
+
+WIFI_CHECK_SEC = 1.0  # Kiểm tra wifi.json do process khác ghi tối đa mỗi giây một lần
+LONG_POLL_MAX_SEC = 60
+
+
+class WifiConfigStore:
+    """wifi.json giữ trong bộ nhớ, kèm version tăng dần và ETag cho ESP32.
+
+    Version lưu ngay trong wifi.json nên mọi worker/process cho cùng ETag.
+    save() ghi file (tmp + os.replace) và cập nhật bộ nhớ ngay; thay đổi do
+    process khác ghi được thấy qua stat, tối đa mỗi check_sec giây.
+    """
+
+    def __init__(self, path: str, check_sec: float = WIFI_CHECK_SEC):
+        self.path = path
+        self.check_sec = check_sec
+        self.config = {}
+        self.version = 0
+        self.etag = None
+        self.body = b""
+        self._stat_key = None
+        self._checked = 0.0
+        self._changed = asyncio.Event()
+        if not os.path.exists(path):
+            self._write({"ssid": "", "password": "", "version": 0})
+        self._load()
+
+    def _stat(self):
+        st = os.stat(self.path)
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _write(self, data: dict):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _load(self):
+        self._stat_key = self._stat()
+        with open(self.path, "r", encoding="utf8") as f:
+            config = json.load(f)
+        self.version = int(config.pop("version", 0))
+        self.config = config
+        self.body = json.dumps({**config, "version": self.version}, ensure_ascii=False).encode()
+        etag = f'"{self.version}-{hashlib.sha1(self.body).hexdigest()[:8]}"'
+        if etag != self.etag:
+            self.etag = etag
+            # Đánh thức các request long-poll đang chờ
+            self._changed.set()
+            self._changed = asyncio.Event()
+
+    def refresh(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._checked < self.check_sec:
+            return
+        self._checked = now
+        try:
+            if self._stat() != self._stat_key:
+                self._load()
+        except (OSError, ValueError):
+            pass
+
+    def save(self, ssid: str, password: str):
+        self.refresh(force=True)
+        self._write({"ssid": ssid, "password": password, "version": self.version + 1})
+        self._load()
+
+    async def wait_change(self, etag: str, timeout: float) -> bool:
+        """Chờ tới khi ETag khác etag hoặc hết timeout; True nếu config đã đổi"""
+        deadline = time.monotonic() + timeout
+        while self.etag == etag:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self._changed.wait(), min(remaining, self.check_sec))
+            except asyncio.TimeoutError:
+                pass
+            self.refresh()
+        return True
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """So khớp If-None-Match (hỗ trợ nhiều giá trị và weak ETag)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+# wifi.json giữ trong bộ nhớ, ESP32 kiểm tra bằng If-None-Match (304) hoặc long-poll
+wifi_config = WifiConfigStore(WIFI_CONFIG_FILE)
+
+router = APIRouter()
+
+
+def install(app: FastAPI):
+    app.include_router(router)
+
+
+@router.get("/wifi_config")
+async def get_wifi_config(request: Request, wait: float = Query(0, ge=0, le=LONG_POLL_MAX_SEC)):
+    """ESP32 lấy WiFi config
+
+    Gửi If-None-Match với ETag lần trước: config không đổi -> 304. Thêm
+    wait=<giây> để giữ request tới khi config đổi (hết hạn vẫn trả 304).
+    """
+    wifi_config.refresh()
+    etag = wifi_config.etag
+    if etag_matches(request, etag) and not (wait and await wifi_config.wait_change(etag, wait)):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return Response(wifi_config.body, media_type="application/json",
+                    headers={"ETag": wifi_config.etag, "Cache-Control": "no-cache"})